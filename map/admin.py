@@ -1,3 +1,5 @@
 from django.contrib import admin
+from .models import Place, CatalogCell
 
-# Register your models here.
+admin.site.register(Place)
+admin.site.register(CatalogCell)
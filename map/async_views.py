@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from weats_backend.instrumentation import stage, timed
+from weats_backend.upstream import get_async_client, loop_local
+from . import catalog
+from .cache import places_cache, ranking_cache
+from .ranking import rank_candidates
+from .views import (
+    MAX_SEARCH_RESULTS, MAX_FINAL_RESULTS, SEARCH_RADIUS, PAGE_TOKEN_RETRY_DELAYS, RANKING_MODEL, RANKING_CONFIG,
+    make_genai_client, get_or_create_prompt, text_search_tiers, merge_tier,
+    places_search_body, read_places_page, text_search_key, lookup_catalog, store_text_search,
+    page_token_not_ready, apply_default_ranking, build_ranking_prompt, parse_ranking_response,
+    ranking_shortlist, ranking_busy, ranking_over_budget, ranking_failed,
+    ranking_slots, ranking_stats, search_flight, search_flight_key,
+    parse_search_request, places_headers, prompt_data, build_search_response, annotate_visited,
+    build_location_dict,
+)
+from .streaming import format_event
+
+logger = logging.getLogger(__name__)
+
+
+async def _close_genai_client(client):
+    # Relies on google-genai 1.18 internals, as it has no public close for its
+    # async HTTP client; if a later version moves it, leave it to the GC
+    http_client = getattr(getattr(client, "_api_client", None), "_async_httpx_client", None)
+    if http_client is not None:
+        await http_client.aclose()
+
+
+def get_async_genai_client():
+    """Async Gemini client for the running event loop."""
+    return loop_local("genai", lambda: make_genai_client().aio, close=_close_genai_client)
+
+
+@timed("places")
+async def post_places_search(body: dict, headers: dict):
+    """Async version of views.post_places_search."""
+    client = get_async_client(settings.PLACES_API_URL)
+    # requests drops unset headers (e.g. a missing API key); httpx refuses them
+    headers = {key: value for key, value in headers.items() if value is not None}
+    response = await client.post(settings.PLACES_API_URL, headers=headers, json=body)
+    if "pageToken" in body:
+        for delay in PAGE_TOKEN_RETRY_DELAYS:
+            if not page_token_not_ready(response):
+                break
+            await asyncio.sleep(delay)
+            response = await client.post(settings.PLACES_API_URL, headers=headers, json=body)
+    return response
+
+
+async def fetch_from_places(text_query: str, cell_lat: float, cell_lng: float, radius: int, headers: dict) -> tuple:
+    """
+    Async version of views.fetch_from_places. Cancelling the task abandons
+    the remaining pages.
+    """
+    restaurants = []
+    page_token = None
+
+    while len(restaurants) < MAX_SEARCH_RESULTS:
+        body = places_search_body(text_query, cell_lat, cell_lng, radius, page_token)
+        try:
+            response = await post_places_search(body, headers)
+        except Exception as e:
+            logger.warning("Places search failed", exc_info=e, extra={"query": text_query})
+            return restaurants, False
+
+        page_token = read_places_page(response, text_query, restaurants)
+        if not page_token:
+            break
+
+    return restaurants, True
+
+
+async def fetch_text_search(text_query: str, lat: float, lng: float, radius: int, headers: dict) -> list:
+    """Async version of views.fetch_text_search, sharing its cache and catalog."""
+    cache_key, cell_lat, cell_lng, text_query = text_search_key(text_query, lat, lng, radius, headers)
+    cached = await places_cache.aget(cache_key)
+    if cached is not None:
+        logger.debug("Places cache hit", extra={"query": text_query})
+        return cached
+
+    if settings.PLACES_CATALOG_ENABLED:
+        restaurants = await sync_to_async(lookup_catalog)(cache_key, text_query, cell_lat, cell_lng, radius, headers)
+        if restaurants is not None:
+            return restaurants
+
+    restaurants, cacheable = await fetch_from_places(text_query, cell_lat, cell_lng, radius, headers)
+    if cacheable:
+        await sync_to_async(store_text_search)(cache_key, text_query, cell_lat, cell_lng, radius, restaurants)
+    return restaurants
+
+
+@timed("search")
+async def search_restaurants(lat: float, lng: float, headers: dict, preferences: dict) -> list:
+    """Async version of views.search_restaurants."""
+    text_queries = text_search_tiers(preferences)
+    tasks = [
+        asyncio.create_task(fetch_text_search(text_query, lat, lng, SEARCH_RADIUS, headers))
+        for text_query in text_queries
+    ]
+
+    restaurants = []
+    seen = set()
+    try:
+        for search_attempt, task in enumerate(tasks):
+            try:
+                results = await task
+            except Exception as e:
+                logger.warning("Places search failed", exc_info=e, extra={"query": text_queries[search_attempt]})
+                continue
+
+            if merge_tier(restaurants, seen, results):
+                break
+    finally:
+        # Abandon speculative tiers we no longer need
+        for task in tasks:
+            task.cancel()
+
+    if not restaurants and settings.PLACES_CATALOG_ENABLED:
+        # Places had nothing for us (or failed); fall back to what earlier searches found nearby
+        restaurants = await sync_to_async(catalog.nearby_places)(lat, lng, SEARCH_RADIUS, MAX_SEARCH_RESULTS)
+    return restaurants
+
+
+# Late Gemini calls still warming the cache; referenced so they are not garbage collected
+_late_rankings = set()
+
+
+def _finish_late_ranking(task: asyncio.Task):
+    _late_rankings.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Late Vertex AI ranking failed", exc_info=task.exception())
+
+
+async def rank_with_vertex(shortlist: list, preferences: dict, cache_key: str) -> list:
+    """Async version of views.rank_with_vertex."""
+    ranking_stats.incr("llm_calls")
+    try:
+        with stage("llm"):
+            response = await get_async_genai_client().models.generate_content(
+                model=RANKING_MODEL,
+                contents=build_ranking_prompt(shortlist, preferences),
+                config=RANKING_CONFIG
+            )
+        filtered_restaurants = parse_ranking_response(response.text, shortlist, preferences)
+    except Exception:
+        ranking_stats.incr("llm_errors")
+        raise
+    await ranking_cache.aset(cache_key, filtered_restaurants)
+    return filtered_restaurants
+
+
+@timed("ranking")
+async def filter_restaurants_with_vertex(restaurants: list, preferences: dict) -> list:
+    """Async version of views.filter_restaurants_with_vertex."""
+    if len(restaurants) <= MAX_FINAL_RESULTS:
+        return apply_default_ranking(restaurants, preferences)
+
+    shortlist, cache_key = ranking_shortlist(restaurants, preferences)
+    cached = await ranking_cache.aget(cache_key)
+    if cached:
+        logger.debug("Ranking cache hit")
+        return cached
+
+    if not ranking_slots.acquire(blocking=False):
+        return ranking_busy(restaurants, preferences)
+
+    task = asyncio.ensure_future(rank_with_vertex(shortlist, preferences, cache_key))
+    task.add_done_callback(lambda _: ranking_slots.release())
+    try:
+        # shield() keeps the call running after the budget so it can still fill the cache
+        return await asyncio.wait_for(asyncio.shield(task), timeout=settings.RANKING_LATENCY_BUDGET)
+
+    except asyncio.TimeoutError:
+        _late_rankings.add(task)
+        task.add_done_callback(_finish_late_ranking)
+        return ranking_over_budget(restaurants, preferences)
+
+    except Exception as e:
+        return ranking_failed(e, restaurants, preferences)
+
+
+async def run_search_pipeline(lat: float, lng: float, preferences: dict) -> list:
+    """Async version of views.run_search_pipeline."""
+    all_restaurants = await search_restaurants(lat, lng, places_headers(), preferences)
+
+    # Rank locally by budget fit, cuisine match and rating
+    all_restaurants = rank_candidates(all_restaurants, preferences)
+
+    # Filter restaurants based on preferences
+    if preferences:
+        return await filter_restaurants_with_vertex(all_restaurants, preferences)
+    return all_restaurants[:MAX_FINAL_RESULTS]
+
+
+async def get_request_user(request):
+    """Authenticate the request the way DRF's JWTAuthentication does for the sync view."""
+    result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    return result[0] if result else None
+
+
+async def nearby_restaurants_async(request):
+    """
+    Async version of views.nearby_restaurants for ASGI workers, so a process
+    can hold many searches that are waiting on Places and Gemini.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    try:
+        user = await get_request_user(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=401)
+
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"detail": "JSON parse error"}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"detail": "Expected a JSON object"}, status=400)
+
+    lat, lng, preferences, error = parse_search_request(data)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+
+    try:
+        filtered_restaurants = await search_flight.ado(
+            search_flight_key(lat, lng, preferences),
+            lambda: run_search_pipeline(lat, lng, preferences)
+        )
+
+        prompt = await sync_to_async(get_or_create_prompt)(prompt_data(lat, lng, preferences))
+
+        body = build_search_response(filtered_restaurants, prompt, user)
+        if data.get("include_visited") and user is not None:
+            await sync_to_async(annotate_visited)(body, user)
+        return JsonResponse(body)
+
+    except Exception as e:
+        logger.exception("Search failed")
+        return JsonResponse({
+            "error": "Failed to fetch restaurants",
+            "details": str(e)
+        }, status=500)
+
+
+# Authentication is by JWT only, like the DRF views
+nearby_restaurants_async.csrf_exempt = True
+
+
+async def stream_search_events(lat: float, lng: float, preferences: dict, user, media_type: str):
+    """
+    Async version of views.stream_search_events. Under ASGI, Django can only
+    send a stream event by event when it is an async iterator.
+    """
+    try:
+        restaurants = await search_restaurants(lat, lng, places_headers(), preferences)
+        all_restaurants = rank_candidates(restaurants, preferences)
+        candidates = [build_location_dict(rest) for rest in all_restaurants[:MAX_FINAL_RESULTS]]
+        yield format_event("candidates", {"restaurants": candidates, "count": len(candidates)}, media_type)
+
+        if preferences:
+            filtered_restaurants = await filter_restaurants_with_vertex(all_restaurants, preferences)
+        else:
+            filtered_restaurants = all_restaurants[:MAX_FINAL_RESULTS]
+
+        prompt = await sync_to_async(get_or_create_prompt)(prompt_data(lat, lng, preferences))
+        yield format_event("ranked", build_search_response(filtered_restaurants, prompt, user), media_type)
+
+    except Exception as e:
+        logger.exception("Streaming search failed")
+        yield format_event("error", {
+            "error": "Failed to fetch restaurants",
+            "details": str(e)
+        }, media_type)
@@ -0,0 +1,281 @@
+"""
+Load-testing harness for the search endpoints, used by `manage.py bench_search`.
+
+Local stand-ins emulate Places text search (with pagination tokens) and
+Gemini generateContent with configurable latency, so the real Django stack
+can be driven under concurrent load without calling Google. Stage timings
+come from the app's own Server-Timing headers (weats_backend.instrumentation).
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+
+PERCENTILES = (50, 95, 99)
+
+
+class StandInServer:
+    """A threaded local HTTP server answering JSON POSTs after a simulated latency."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stand_in = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, path: str, body: dict) -> tuple:
+        with self._lock:
+            self.requests += 1
+        time.sleep(max(self.latency + random.uniform(-self.jitter, self.jitter), 0))
+        return self.respond(path, body)
+
+    def respond(self, path: str, body: dict) -> tuple:
+        """Return (status, response body)."""
+        raise NotImplementedError
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the Google endpoints
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = {}
+        status, payload = self.server.stand_in.handle(self.path, body)
+        data = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on this request (e.g. a cancelled tier); drop the connection
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePlacesServer(StandInServer):
+    """
+    Emulates places:searchText. Every text query around a location has its own
+    stable set of restaurants, served `per_page` at a time over `pages` pages.
+    """
+    path = "/v1/places:searchText"
+
+    def __init__(self, pages: int = 3, per_page: int = 20, **kwargs):
+        super().__init__(**kwargs)
+        self.pages = pages
+        self.per_page = per_page
+
+    @property
+    def url(self) -> str:
+        return self.base_url + self.path
+
+    def respond(self, path: str, body: dict) -> tuple:
+        if "pageToken" in body:
+            seed, _, page = body["pageToken"].rpartition(":")
+            page = int(page)
+        else:
+            center = body.get("locationBias", {}).get("circle", {}).get("center", {})
+            seed = hashlib.sha1(repr((body.get("textQuery"), center)).encode("utf-8")).hexdigest()[:10]
+            page = 0
+
+        places = [self.place(seed, page * self.per_page + i) for i in range(self.per_page)]
+        payload = {"places": places}
+        if page + 1 < self.pages:
+            payload["nextPageToken"] = f"{seed}:{page + 1}"
+        return 200, payload
+
+    @staticmethod
+    def place(seed: str, i: int) -> dict:
+        rng = random.Random(f"{seed}:{i}")
+        return {
+            "id": f"{seed}-{i}",
+            "displayName": {"text": f"Restaurant {seed[:4]} {i}"},
+            "formattedAddress": f"{i} Benchmark Street",
+            "location": {"latitude": 14.55 + rng.uniform(-0.01, 0.01), "longitude": 121.02 + rng.uniform(-0.01, 0.01)},
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "userRatingCount": rng.randint(0, 2000),
+            "priceLevel": rng.choice(["PRICE_LEVEL_INEXPENSIVE", "PRICE_LEVEL_MODERATE", "PRICE_LEVEL_EXPENSIVE"]),
+            "types": ["restaurant", rng.choice(["ramen_restaurant", "cafe", "vegan_restaurant", "steak_house"])],
+            "photos": [],
+        }
+
+
+class FakeGeminiServer(StandInServer):
+    """Emulates Gemini generateContent, ranking the first candidates in order."""
+
+    def __init__(self, ranked: int = 10, **kwargs):
+        super().__init__(**kwargs)
+        self.ranked = ranked
+
+    def respond(self, path: str, body: dict) -> tuple:
+        if not path.endswith(":generateContent"):
+            return 404, {"error": {"code": 404, "message": f"Unknown path {path}", "status": "NOT_FOUND"}}
+
+        ranking = [
+            {"id": i + 1, "rank": i + 1, "description": "A benchmark restaurant.", "reason": "Benchmark ranking."}
+            for i in range(self.ranked)
+        ]
+        return 200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": json.dumps(ranking)}]},
+                "finishReason": "STOP",
+            }],
+        }
+
+
+class ASGIServer:
+    """Serves an ASGI application with uvicorn on a background thread."""
+
+    def __init__(self, app):
+        import uvicorn
+        config = uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout: float = 10.0):
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("The ASGI server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join()
+
+
+def parse_server_timing(header: str) -> dict:
+    """Stage seconds from a Server-Timing header, as ServerTimingMiddleware writes it."""
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name and duration and name != "total":
+            try:
+                stages[name] = float(duration) / 1000
+            except ValueError:
+                pass
+    return stages
+
+
+def search_bodies(count: int, cells: int, seed: int = 0) -> list:
+    """Request bodies spread over `cells` distinct locations and a few preference sets."""
+    rng = random.Random(seed)
+    preferences = [
+        {"food_preference": "ramen", "price": 300},
+        {"food_preference": "vegan", "dietary_preference": "vegan", "price": 150},
+        {"food_preference": "steak", "price": 800},
+        {},
+    ]
+    centres = [(14.5 + rng.uniform(0, 0.2), 121.0 + rng.uniform(0, 0.2)) for _ in range(cells)]
+    bodies = []
+    for _ in range(count):
+        lat, lng = rng.choice(centres)
+        body = {"lat": lat, "lng": lng}
+        chosen = rng.choice(preferences)
+        if chosen:
+            body["preferences"] = chosen
+        bodies.append(body)
+    return bodies
+
+
+def drive_load(url: str, bodies: list, concurrency: int, headers: dict = None) -> tuple:
+    """
+    POST every body to url from `concurrency` threads. Returns the results as
+    (status, seconds to first byte, seconds in total, stage seconds from the
+    Server-Timing header) and the wall-clock time.
+    """
+    results = []
+    lock = threading.Lock()
+    pending = iter(bodies)
+    local = threading.local()
+
+    def worker():
+        local.session = requests.Session()
+        while True:
+            with lock:
+                body = next(pending, None)
+            if body is None:
+                return
+            start = time.perf_counter()
+            try:
+                with local.session.post(url, json=body, headers=headers, stream=True) as response:
+                    response.raw.read(1)
+                    first_byte = time.perf_counter() - start
+                    response.raw.read()
+                    status = response.status_code
+                    stages = parse_server_timing(response.headers.get("Server-Timing"))
+            except requests.RequestException:
+                status, first_byte, stages = 0, time.perf_counter() - start, {}
+            with lock:
+                results.append((status, first_byte, time.perf_counter() - start, stages))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return results, time.perf_counter() - started
+
+
+def summarize(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    array = np.array(values) * 1000  # milliseconds
+    summary = {"count": len(values), "mean": float(array.mean())}
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}"] = float(np.percentile(array, percentile))
+    summary["max"] = float(array.max())
+    return summary
+
+
+def build_report(results: list, elapsed: float, upstream: dict, counters: dict) -> dict:
+    ok = [result for result in results if result[0] == 200]
+    stages = {}
+    for result in ok:
+        for stage, seconds in result[3].items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed": elapsed,
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "latency": summarize([result[2] for result in ok]),
+        "first_byte": summarize([result[1] for result in ok]),
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stages.items())},
+        "upstream_requests": upstream,
+        "counters": counters,
+    }
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from django.conf import settings
+from django.core.cache import caches
+
+_MISS = object()
+
+
+def geocell(lat: float, lng: float, precision: int = None) -> tuple:
+    """Snap a coordinate pair to the centre of its grid cell."""
+    if precision is None:
+        precision = settings.PLACES_CACHE_GEOCELL_PRECISION
+    return round(float(lat), precision), round(float(lng), precision)
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase a free-text query and collapse its whitespace."""
+    return " ".join(str(text or "").lower().split())
+
+
+class Counters:
+    """Thread-safe named counters."""
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(names, 0)
+
+    def incr(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+class CacheStats(Counters):
+    """Hit/miss counters for a ResultCache."""
+
+    def __init__(self):
+        super().__init__("hits", "negative_hits", "misses", "stores", "negative_stores")
+
+
+class ResultCache:
+    """
+    TTL cache for upstream results stored in a Django cache alias.
+
+    Empty results are cached as negative entries with a shorter TTL so a dead
+    area or a failing upstream is not hammered on every request. Eviction is
+    left to the backend (LocMemCache culls least recently used entries once
+    MAX_ENTRIES is reached).
+    """
+
+    def __init__(self, alias: str, prefix: str, ttl: int, negative_ttl: int):
+        self.alias = alias
+        self.prefix = prefix
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = CacheStats()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, *parts) -> str:
+        digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def get(self, key: str, default=None):
+        value = self.backend.get(key, _MISS)
+        if value is _MISS:
+            self.stats.incr("misses")
+            return default
+        self.stats.incr("hits" if value else "negative_hits")
+        return value
+
+    def set(self, key: str, value):
+        if value:
+            self.backend.set(key, value, self.ttl)
+            self.stats.incr("stores")
+        else:
+            self.backend.set(key, value, self.negative_ttl)
+            self.stats.incr("negative_stores")
+
+    async def aget(self, key: str, default=None):
+        value = await self.backend.aget(key, _MISS)
+        if value is _MISS:
+            self.stats.incr("misses")
+            return default
+        self.stats.incr("hits" if value else "negative_hits")
+        return value
+
+    async def aset(self, key: str, value):
+        if value:
+            await self.backend.aset(key, value, self.ttl)
+            self.stats.incr("stores")
+        else:
+            await self.backend.aset(key, value, self.negative_ttl)
+            self.stats.incr("negative_stores")
+
+
+places_cache = ResultCache(
+    alias="places",
+    prefix="places:search",
+    ttl=settings.PLACES_CACHE_TTL,
+    negative_ttl=settings.PLACES_CACHE_NEGATIVE_TTL,
+)
+
+# Only successful rankings are stored, so there is nothing to negatively cache
+ranking_cache = ResultCache(
+    alias="ranking",
+    prefix="ranking:gemini",
+    ttl=settings.RANKING_CACHE_TTL,
+    negative_ttl=0,
+)
@@ -0,0 +1,157 @@
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from weats_backend.instrumentation import timed
+from .cache import geocell
+from .models import Place, CatalogCell
+
+# Background refreshes of stale cells; one at a time per cell
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalog-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+METERS_PER_DEGREE = 111_320
+
+
+def geocell_key(lat: float, lng: float) -> str:
+    return f"{lat}:{lng}"
+
+
+def place_geocell(lat, lng) -> str:
+    """The catalog cell a place itself lies in ('' when it has no location)."""
+    if lat is None or lng is None:
+        return ""
+    return geocell_key(*geocell(lat, lng, settings.PLACES_CATALOG_GEOCELL_PRECISION))
+
+
+def cells_around(lat: float, lng: float, radius: int) -> list:
+    """Keys of the catalog cells that overlap a circle of `radius` meters."""
+    precision = settings.PLACES_CATALOG_GEOCELL_PRECISION
+    size = 10 ** -precision
+    center_lat, center_lng = geocell(lat, lng, precision)
+    lat_steps = math.ceil(radius / METERS_PER_DEGREE / size)
+    lng_steps = math.ceil(radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)) / size)
+    return [
+        geocell_key(round(center_lat + i * size, precision), round(center_lng + j * size, precision))
+        for i in range(-lat_steps, lat_steps + 1)
+        for j in range(-lng_steps, lng_steps + 1)
+    ]
+
+
+def distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Approximate distance in meters; accurate enough at search radii."""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * 6_371_000
+
+
+@timed("db")
+def nearby_places(lat: float, lng: float, radius: int, limit: int) -> list:
+    """
+    Cataloged places within `radius` meters, nearest first, whatever search
+    found them. One indexed lookup over the surrounding cells.
+    """
+    places = []
+    for place in Place.objects.filter(geocell__in=cells_around(lat, lng, radius)):
+        meters = distance(lat, lng, place.lat, place.lng)
+        if meters <= radius:
+            places.append((meters, place))
+    places.sort(key=lambda item: item[0])
+    return [place.to_restaurant() for _, place in places[:limit]]
+
+
+@timed("db")
+def load_cell(key: str):
+    """
+    Return (restaurants, date_refreshed) for a cataloged search, or None if
+    the search was never stored or one of its places is gone.
+    """
+    cell = CatalogCell.objects.filter(key=key).first()
+    if cell is None:
+        return None
+
+    places = Place.objects.in_bulk(cell.place_ids, field_name="place_id")
+    if len(places) != len(set(cell.place_ids)):
+        return None
+    return [places[place_id].to_restaurant() for place_id in cell.place_ids], cell.date_refreshed
+
+
+@timed("db")
+def store_cell(key: str, cell_lat: float, cell_lng: float, text_query: str, radius: int, restaurants: list):
+    """Upsert the places of a search by Places ID and record the search's result order."""
+    if not restaurants or any(not restaurant.get("place_id") for restaurant in restaurants):
+        return
+
+    places = {}
+    for restaurant in restaurants:
+        places[restaurant["place_id"]] = Place(
+            place_id=restaurant["place_id"],
+            name=restaurant.get("name"),
+            address=restaurant.get("address"),
+            lat=restaurant.get("lat"),
+            lng=restaurant.get("lng"),
+            geocell=place_geocell(restaurant.get("lat"), restaurant.get("lng")),
+            rating=restaurant.get("rating"),
+            user_ratings_total=restaurant.get("user_ratings_total"),
+            price_level=restaurant.get("price_level"),
+            types=restaurant.get("types", []),
+            photos=restaurant.get("photos", []),
+        )
+
+    with transaction.atomic():
+        Place.objects.bulk_create(
+            places.values(),
+            update_conflicts=True,
+            unique_fields=["place_id"],
+            update_fields=[
+                "name", "address", "lat", "lng", "geocell", "rating",
+                "user_ratings_total", "price_level", "types", "photos", "date_updated",
+            ],
+        )
+        CatalogCell.objects.update_or_create(
+            key=key,
+            defaults={
+                "geocell": geocell_key(cell_lat, cell_lng),
+                "text_query": text_query[:255],
+                "radius": radius,
+                "place_ids": list(places),
+                "date_refreshed": timezone.now(),
+            },
+        )
+
+
+def is_fresh(date_refreshed) -> bool:
+    return timezone.now() - date_refreshed < timedelta(seconds=settings.PLACES_CATALOG_FRESH_TTL)
+
+
+def is_servable(date_refreshed) -> bool:
+    """Stale cells can still be served while they are refreshed in the background."""
+    return timezone.now() - date_refreshed < timedelta(seconds=settings.PLACES_CATALOG_MAX_STALE)
+
+
+def schedule_refresh(key: str, refresh):
+    """Run refresh() in the background unless this cell is already being refreshed."""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            refresh()
+        except Exception:
+            logger.exception("Error refreshing catalog cell", extra={"key": key})
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+            close_old_connections()
+
+    refresh_executor.submit(run)
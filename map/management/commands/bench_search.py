@@ -0,0 +1,150 @@
+import json
+import os
+import tempfile
+import threading
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.core.asgi import get_asgi_application
+from django.core.servers.basehttp import ThreadedWSGIServer, get_internal_wsgi_application
+from django.db import connections
+from django.test.testcases import QuietWSGIRequestHandler
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from map.benchmark import ASGIServer, FakePlacesServer, FakeGeminiServer, search_bodies, drive_load, build_report
+from map.views import get_genai_client, places_cache, ranking_cache, ranking_stats, search_flight
+
+ENDPOINTS = {
+    "sync": "/api/maps/search_places/",
+    "async": "/api/maps/search_places_async/",
+    "stream": "/api/maps/search_places_stream/",
+}
+CACHE_ALIASES = ("shared", "places", "ranking")
+# Reported as their change over the measured requests
+COUNTERS = {
+    "ranking": ranking_stats,
+    "places_cache": places_cache.stats,
+    "ranking_cache": ranking_cache.stats,
+    "search_flight": search_flight.stats,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark a search endpoint through the full Django stack, with local stand-ins "
+        "for Places and Gemini and a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="sync",
+                            help="Stage timings come from Server-Timing, which streams send before any stage ends.")
+        parser.add_argument("--server", choices=("wsgi", "asgi"),
+                            help="Defaults to asgi for the async endpoint and wsgi otherwise.")
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests.")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring.")
+        parser.add_argument("--cells", type=int, default=50,
+                            help="Distinct search locations; fewer means more cache hits.")
+        parser.add_argument("--places-latency", type=float, default=0.15, help="Seconds per Places request.")
+        parser.add_argument("--places-jitter", type=float, default=0.05)
+        parser.add_argument("--places-pages", type=int, default=3)
+        parser.add_argument("--llm-latency", type=float, default=1.5, help="Seconds per Gemini request.")
+        parser.add_argument("--llm-jitter", type=float, default=0.3)
+        parser.add_argument("--keep-caches", action="store_true",
+                            help="Do not clear the search caches before the run.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", dest="json_path", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        places = FakePlacesServer(
+            pages=options["places_pages"], latency=options["places_latency"], jitter=options["places_jitter"]
+        ).start()
+        gemini = FakeGeminiServer(latency=options["llm_latency"], jitter=options["llm_jitter"]).start()
+
+        database_dir = tempfile.TemporaryDirectory()
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict["ENGINE"].endswith("sqlite3") and not settings_dict["TEST"].get("NAME"):
+                # On disk, so request threads get their own connections
+                settings_dict["TEST"]["NAME"] = os.path.join(database_dir.name, f"{alias}.sqlite3")
+        old_config = setup_databases(verbosity=0, interactive=False)
+
+        server_kind = options["server"] or ("asgi" if options["endpoint"] == "async" else "wsgi")
+        server = None
+        try:
+            with override_settings(
+                PLACES_API_URL=places.url,
+                GENAI_BASE_URL=gemini.base_url,
+                GENAI_API_KEY="bench",
+                SERVER_TIMING_ENABLED=True,
+            ):
+                get_genai_client.cache_clear()
+                if not options["keep_caches"]:
+                    for alias in CACHE_ALIASES:
+                        caches[alias].clear()
+
+                if server_kind == "asgi":
+                    server = ASGIServer(get_asgi_application()).start()
+                    base_url = server.base_url
+                else:
+                    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+                    server.set_app(get_internal_wsgi_application())
+                    threading.Thread(target=server.serve_forever, daemon=True).start()
+                    host, port = server.server_address[:2]
+                    base_url = f"http://{host}:{port}"
+                url = base_url + ENDPOINTS[options["endpoint"]]
+
+                bodies = search_bodies(options["warmup"] + options["requests"], options["cells"], options["seed"])
+                drive_load(url, bodies[:options["warmup"]], options["concurrency"])
+                places.requests = gemini.requests = 0
+                before = {name: counters.snapshot() for name, counters in COUNTERS.items()}
+
+                results, elapsed = drive_load(url, bodies[options["warmup"]:], options["concurrency"])
+                counters = {
+                    name: {key: value - before[name].get(key, 0) for key, value in counters.snapshot().items()}
+                    for name, counters in COUNTERS.items()
+                }
+                report = build_report(results, elapsed, {"places": places.requests, "gemini": gemini.requests}, counters)
+        finally:
+            if isinstance(server, ASGIServer):
+                server.stop()
+            elif server is not None:
+                server.shutdown()
+                server.server_close()
+            places.stop()
+            gemini.stop()
+            get_genai_client.cache_clear()
+            teardown_databases(old_config, verbosity=0)
+            database_dir.cleanup()
+
+        report["options"] = {
+            key: options[key]
+            for key in ("endpoint", "requests", "concurrency", "cells", "places_latency", "places_pages", "llm_latency")
+        }
+        report["options"]["server"] = server_kind
+        self.write_report(report)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def write_report(self, report: dict):
+        self.stdout.write(
+            f"{report['requests']} requests ({report['errors']} errors) in {report['elapsed']:.2f}s, "
+            f"{report['throughput']:.1f} req/s"
+        )
+        columns = ("count", "mean", "p50", "p95", "p99", "max")
+        self.stdout.write(f"{'ms':<18}" + "".join(f"{column:>9}" for column in columns))
+        rows = [("latency", report["latency"]), ("first byte", report["first_byte"])]
+        rows += [(f"  {stage}", summary) for stage, summary in report["stages"].items()]
+        for name, summary in rows:
+            cells = [f"{summary.get(column, 0):>9.1f}" if column != "count" else f"{summary['count']:>9}"
+                     for column in columns]
+            self.stdout.write(f"{name:<18}" + "".join(cells))
+        upstream = report["upstream_requests"]
+        self.stdout.write(f"Upstream requests: {upstream['places']} Places, {upstream['gemini']} Gemini")
+        ranking = report["counters"]["ranking"]
+        self.stdout.write(
+            f"Ranking: {ranking['llm_calls']} Gemini calls, {ranking['llm_errors']} errors; local fallback for "
+            f"{ranking['budget_exceeded']} over budget and {ranking['busy']} with too many in flight"
+        )
+        for name in ("places_cache", "ranking_cache", "search_flight"):
+            counts = ", ".join(f"{value} {key}" for key, value in report["counters"][name].items())
+            self.stdout.write(f"{name.replace('_', ' ').capitalize()}: {counts}")
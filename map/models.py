@@ -1,3 +1,48 @@
 from django.db import models
 
-# Create your models here.
+
+class Place(models.Model):
+    """A Places API result, kept so later searches in the area can be answered locally."""
+    place_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255, null=True, blank=True)
+    address = models.TextField(null=True, blank=True)
+    lat = models.FloatField(null=True, blank=True)
+    lng = models.FloatField(null=True, blank=True)
+    geocell = models.CharField(max_length=32, db_index=True)  # "lat:lng" of the catalog cell the place lies in
+    rating = models.FloatField(null=True, blank=True)
+    user_ratings_total = models.IntegerField(null=True, blank=True)
+    price_level = models.IntegerField(null=True, blank=True)
+    types = models.JSONField(null=True, blank=True)  # stores array of strings
+    photos = models.JSONField(null=True, blank=True)  # Places photo objects
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def to_restaurant(self) -> dict:
+        """The restaurant dict map.views.parse_place builds for this place."""
+        return {
+            "place_id": self.place_id,
+            "name": self.name,
+            "address": self.address,
+            "lat": self.lat,
+            "lng": self.lng,
+            "rating": self.rating,
+            "user_ratings_total": self.user_ratings_total,
+            "price_level": self.price_level,
+            "types": self.types or [],
+            "photos": self.photos or [],
+        }
+
+    def __str__(self):
+        return self.name or self.place_id
+
+
+class CatalogCell(models.Model):
+    """The results of one Places text search around one geocell, in Places order."""
+    key = models.CharField(max_length=64, unique=True)  # same key as the Places result cache
+    geocell = models.CharField(max_length=32, db_index=True)
+    text_query = models.CharField(max_length=255)
+    radius = models.IntegerField()
+    place_ids = models.JSONField(default=list)
+    date_refreshed = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.text_query} @ {self.geocell}"
@@ -0,0 +1,94 @@
+import re
+import numpy as np
+
+# Weights of the score components, summing to 1
+BUDGET_WEIGHT = 0.35
+MATCH_WEIGHT = 0.35
+RATING_WEIGHT = 0.30
+
+PRIOR_REVIEWS = 50      # Reviews needed before a place's own rating outweighs the area average
+DEFAULT_RATING = 3.5    # Prior when no candidate has a rating
+UNKNOWN_PRICE_FIT = 0.5  # Budget fit of places without a price level
+
+# Words in a preference that do not describe a cuisine or diet
+STOP_WORDS = {"any", "restaurant", "food", "me", "surprise", "choosee", "not", "choosy", "atm"}
+
+
+def map_price_to_level(peso):
+    """Convert a budget in pesos to a Places price level."""
+    if peso <= 0:
+        return 0
+    elif peso <= 150:
+        return 1
+    elif peso <= 300:
+        return 2
+    elif peso <= 600:
+        return 3
+    else:
+        return 4
+
+
+def preference_price_level(preferences: dict) -> int:
+    """Convert the preference price (in pesos) to a price level."""
+    raw_price = preferences.get("price", 1000)
+    return map_price_to_level(raw_price) if isinstance(raw_price, (int, float)) else 4
+
+
+def preference_terms(*values) -> set:
+    words = set()
+    for value in values:
+        words.update(re.findall(r"[a-z]+", str(value or "").lower()))
+    return {word for word in words if len(word) > 2 and word not in STOP_WORDS}
+
+
+def score_candidates(restaurants: list, preferences: dict) -> np.ndarray:
+    """
+    Score every candidate in [0, 1] from budget fit, cuisine/diet match and a
+    Bayesian rating that shrinks sparsely reviewed places towards the mean.
+    """
+    if not restaurants:
+        return np.zeros(0)
+
+    price = np.array([r.get("price_level") for r in restaurants], dtype=float)  # None -> nan
+    rating = np.array([r.get("rating") for r in restaurants], dtype=float)
+    reviews = np.array([r.get("user_ratings_total") or 0 for r in restaurants], dtype=float)
+
+    # Budget fit: 1 within budget, halving per level above it. Level 0 means no budget was given.
+    budget = preference_price_level(preferences)
+    if budget > 0:
+        over_budget = np.clip(price - budget, 0, None)
+        budget_fit = np.where(np.isnan(price), UNKNOWN_PRICE_FIT, 0.5 ** over_budget)
+    else:
+        budget_fit = np.ones(len(restaurants))
+
+    # Cuisine/diet match: share of preference terms found in the place types or name
+    terms = preference_terms(preferences.get("food_preference"), preferences.get("dietary_preference"))
+    if terms:
+        haystacks = [
+            " ".join((r.get("types") or []) + [r.get("name") or ""]).lower()
+            for r in restaurants
+        ]
+        matches = np.array([[term in haystack for term in terms] for haystack in haystacks], dtype=float)
+        match = matches.mean(axis=1)
+    else:
+        match = np.zeros(len(restaurants))
+
+    # Bayesian average: (v * R + m * C) / (v + m)
+    known = ~np.isnan(rating)
+    prior = rating[known].mean() if known.any() else DEFAULT_RATING
+    rating = np.where(known, rating, prior)
+    reviews = np.where(known, reviews, 0)
+    bayesian_rating = (reviews * rating + PRIOR_REVIEWS * prior) / (reviews + PRIOR_REVIEWS)
+
+    return (
+        BUDGET_WEIGHT * budget_fit
+        + MATCH_WEIGHT * match
+        + RATING_WEIGHT * bayesian_rating / 5.0
+    )
+
+
+def rank_candidates(restaurants: list, preferences: dict) -> list:
+    """Return the restaurants ordered from best to worst local score."""
+    scores = score_candidates(restaurants, preferences)
+    order = np.argsort(-scores, kind="stable")
+    return [restaurants[i] for i in order]
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from django.core.cache import caches
+from .cache import Counters
+
+_MISS = object()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key: one leader runs the function
+    and everyone else waits for its result.
+
+    Within a process followers wait on the leader directly. Across workers the
+    leader holds a lock in a shared cache alias (cache.add is atomic on Redis,
+    memcached and locmem) and publishes its result there for a few seconds;
+    followers in other workers poll for it and only run the function
+    themselves if the leader fails or takes longer than wait_timeout.
+    """
+
+    def __init__(self, alias: str, prefix: str, lock_ttl: int, result_ttl: int,
+                 wait_timeout: float, poll_interval: float = 0.1):
+        self.alias = alias
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.stats = Counters("leaders", "followers", "shared_hits", "wait_timeouts")
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def do(self, key: str, fn):
+        """Return fn() for this key, sharing one execution with concurrent callers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self.stats.incr("followers")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _do_shared(self, key: str, fn):
+        lock_key = f"{self.prefix}:lock:{key}"
+        result_key = f"{self.prefix}:result:{key}"
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            result = self.backend.get(result_key, _MISS)
+            if result is not _MISS:
+                self.stats.incr("shared_hits")
+                return result
+
+            if self.backend.add(lock_key, 1, self.lock_ttl):
+                self.stats.incr("leaders")
+                try:
+                    result = fn()
+                    self.backend.set(result_key, result, self.result_ttl)
+                    return result
+                finally:
+                    self.backend.delete(lock_key)
+
+            if time.monotonic() > deadline:
+                self.stats.incr("wait_timeouts")
+                return fn()
+            time.sleep(self.poll_interval)
+
+    async def ado(self, key: str, fn):
+        """Async version of do(); fn is a coroutine function."""
+        loop = asyncio.get_running_loop()
+        calls = self._async_calls.setdefault(loop, {})
+        future = calls.get(key)
+        if future is not None:
+            self.stats.incr("followers")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.ado(key, fn)  # The leader was cancelled, not us; take over
+                raise
+
+        future = calls[key] = loop.create_future()
+        try:
+            result = await self._ado_shared(key, fn)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody was following
+            raise
+        finally:
+            del calls[key]
+            if not calls:
+                del self._async_calls[loop]
+
+    async def _ado_shared(self, key: str, fn):
+        lock_key = f"{self.prefix}:lock:{key}"
+        result_key = f"{self.prefix}:result:{key}"
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            result = await self.backend.aget(result_key, _MISS)
+            if result is not _MISS:
+                self.stats.incr("shared_hits")
+                return result
+
+            if await self.backend.aadd(lock_key, 1, self.lock_ttl):
+                self.stats.incr("leaders")
+                try:
+                    result = await fn()
+                    await self.backend.aset(result_key, result, self.result_ttl)
+                    return result
+                finally:
+                    await self.backend.adelete(lock_key)
+
+            if time.monotonic() > deadline:
+                self.stats.incr("wait_timeouts")
+                return await fn()
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,33 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+def format_event(event: str, data, media_type: str) -> bytes:
+    """Encode one event as a Server-Sent Event or an NDJSON line."""
+    if media_type == NDJSONRenderer.media_type:
+        return (json.dumps({"event": event, "data": data}) + "\n").encode("utf-8")
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Negotiates text/event-stream for streaming views. Streams are written by
+    the view itself; this only renders plain Responses (e.g. validation
+    errors) as a single error event.
+    """
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event("error", data, self.media_type)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON counterpart of EventStreamRenderer."""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event("error", data, self.media_type)
@@ -1,3 +1,494 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from suggestions.models import Prompt
+from visited.models import VisitedLocation
+from weats_backend.testing import QueryBudgetMixin, FakePlaces, FakeGemini
+from . import async_views, catalog, views
+from .models import Place
+from .ranking import rank_candidates
+from .singleflight import SingleFlight
+from .views import parse_ranking_response
 
-# Create your tests here.
+User = get_user_model()
+
+SEARCH = {"lat": 14.5547, "lng": 121.0244, "preferences": {"food_preference": "ramen", "price": 300}}
+
+
+# Search tiers run on worker threads, which cannot see rows written inside a test transaction
+@override_settings(PLACES_CATALOG_ENABLED=False)
+class SearchTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        for alias in ("default", "shared", "places", "ranking"):
+            caches[alias].clear()
+        self.user = User.objects.create_user(email="eater@example.com", username="eater", password="password123")
+        self.client = APIClient()
+        self.places = FakePlaces()
+        self.gemini = FakeGemini()
+        stubs = ExitStack()
+        stubs.enter_context(self.places.patch())
+        stubs.enter_context(self.gemini.patch())
+        self.addCleanup(stubs.close)
+
+    def seed_prompts(self, size: int):
+        """Bring the Prompt table to `size` rows."""
+        start = Prompt.objects.count()
+        Prompt.objects.bulk_create([Prompt(lat=i, lng=i) for i in range(start, size)])
+
+
+class SearchPlacesTests(SearchTestCase):
+    url = "/api/maps/search_places/"
+
+    def search(self, body=SEARCH):
+        return self.client.post(self.url, body, format="json")
+
+    def test_ranks_with_gemini_when_there_are_preferences(self):
+        response = self.search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 10)
+        self.assertEqual(response.data["restaurants"][0]["description"], "Ranked by the stub")
+        self.assertEqual(self.gemini.calls, 1)
+        self.assertEqual(Prompt.objects.get(pk=response.data["prompt_id"]).price, 300)
+
+    def test_ranks_locally_when_too_many_rankings_are_in_flight(self):
+        with mock.patch("map.views.ranking_slots", threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            response = self.search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.gemini.calls, 0)
+        self.assertEqual(response.data["count"], 10)
+
+    @override_settings(PLACES_CATALOG_ENABLED=True)
+    def test_falls_back_to_cataloged_places_nearby(self):
+        catalog.store_cell("other-search", 14.553, 121.026, "sushi", 2000, [
+            {"place_id": "near", "name": "Near", "lat": 14.556, "lng": 121.025},
+            {"place_id": "far", "name": "Far", "lat": 14.7, "lng": 121.2},
+        ])
+        with mock.patch("map.views.fetch_text_search_in_pool", return_value=[]):
+            response = self.search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([restaurant["place_id"] for restaurant in response.data["restaurants"]], ["near"])
+
+    @override_settings(PLACES_CATALOG_ENABLED=True)
+    def test_catalog_failures_do_not_drop_places_results(self):
+        locked = OperationalError("database is locked")
+        with mock.patch("map.catalog.load_cell", side_effect=locked), \
+                mock.patch("map.catalog.store_cell", side_effect=locked), \
+                self.assertLogs("map.views", "WARNING") as logs:
+            response = self.search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 10)
+        self.assertIn("Catalog store failed", "\n".join(logs.output))
+
+    def test_ranking_releases_its_slot(self):
+        with mock.patch("map.views.ranking_slots", threading.BoundedSemaphore(1)) as slots:
+            self.search()
+            self.assertTrue(slots.acquire(blocking=False))
+        self.assertEqual(self.gemini.calls, 1)
+
+    @override_settings(RANKING_LATENCY_BUDGET=0.05)
+    def test_cancels_rankings_still_queued_after_the_budget(self):
+        executor, busy = ThreadPoolExecutor(max_workers=1), threading.Event()
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(busy.set)
+        executor.submit(busy.wait)  # Occupies the only worker
+        with mock.patch("map.views.ranking_executor", executor), \
+                mock.patch("map.views.ranking_slots", threading.BoundedSemaphore(1)) as slots:
+            self.assertEqual(self.search().data["count"], 10)
+            self.assertTrue(slots.acquire(blocking=False))
+        busy.set()
+        executor.shutdown()
+        self.assertEqual(self.gemini.calls, 0)
+
+    def test_skips_gemini_without_preferences(self):
+        response = self.search({"lat": SEARCH["lat"], "lng": SEARCH["lng"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.gemini.calls, 0)
+
+    def test_repeated_searches_are_served_from_cache(self):
+        self.search()
+        places_calls, gemini_calls = len(self.places.calls), self.gemini.calls
+        caches["shared"].clear()  # Drop the coalesced result so the pipeline runs again
+
+        nearby = dict(SEARCH, lat=SEARCH["lat"] + 0.00002)
+        self.assertEqual(self.search(nearby).status_code, 200)
+        self.assertEqual(len(self.places.calls), places_calls)
+        self.assertEqual(self.gemini.calls, gemini_calls)
+
+    def test_query_count_does_not_grow_with_prompts(self):
+        self.search()  # Creates the prompt; later searches reuse it
+
+        def seed(size):
+            self.seed_prompts(size)
+            for alias in ("shared", "places", "ranking"):
+                caches[alias].clear()  # So every search calls Places and Gemini again
+
+        measurements = self.assertConstantQueries(seed, self.search, limit=1, counters={
+            "places": lambda: len(self.places.calls),
+            "gemini": lambda: self.gemini.calls,
+        })
+        self.assertEqual(measurements[0][1]["gemini"], 1)
+
+    def test_authenticated_search(self):
+        self.client.force_authenticate(self.user)
+        response = self.assertMaxQueries(4, self.search)
+        self.assertEqual(response.data["suggestion_id"]["user"], "eater")
+
+    def test_include_visited(self):
+        first = self.search()
+        self.assertNotIn("is_visited", first.data["restaurants"][0])
+
+        restaurant = first.data["restaurants"][1]
+        VisitedLocation.objects.create(user=self.user, **{
+            field: restaurant[field] for field in ("place_id", "name", "address", "lat", "lng")
+        })
+        self.client.force_authenticate(self.user)
+        response = self.search(dict(SEARCH, include_visited=True))
+        flags = [restaurant["is_visited"] for restaurant in response.data["restaurants"]]
+        self.assertEqual(flags, [False, True] + [False] * 8)
+
+    def test_rejects_missing_coordinates(self):
+        self.assertEqual(self.search({"lat": SEARCH["lat"]}).status_code, 400)
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_and_metrics(self):
+        response = self.search()
+        stages = dict(part.split(";dur=") for part in response["Server-Timing"].split(", "))
+        for stage in ("search", "places", "ranking", "llm", "db", "serialize", "total"):
+            self.assertIn(stage, stages)
+
+        metrics = self.client.get("/metrics/").content.decode()
+        self.assertIn('weats_stage_duration_seconds_count{stage="places"}', metrics)
+        self.assertIn('weats_request_duration_seconds_count{route="api/maps/search_places/"}', metrics)
+        self.assertIn("weats_ranking_llm_calls_total", metrics)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 401)
+        self.assertEqual(self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+    def test_metrics_are_closed_by_default(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 401)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+
+class StreamingSearchTests(SearchTestCase):
+    url = "/api/maps/search_places_stream/"
+
+    def stream(self, accept):
+        response = self.client.post(self.url, SEARCH, format="json", HTTP_ACCEPT=accept)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_server_sent_events(self):
+        response, body = self.stream("text/event-stream")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertIn("event: candidates", body)
+        self.assertIn("event: ranked", body)
+
+    def test_ndjson(self):
+        response, body = self.stream("application/x-ndjson")
+        events = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([event["event"] for event in events], ["candidates", "ranked"])
+        self.assertEqual(events[-1]["data"]["count"], 10)
+
+    async def test_streams_events_as_they_happen_under_asgi(self):
+        response = await self.async_client.post(
+            self.url, SEARCH, content_type="application/json", headers={"Accept": "application/x-ndjson"}
+        )
+        self.assertTrue(response.is_async)
+        events = aiter(response.streaming_content)
+        first = json.loads(await anext(events))
+        self.assertEqual(first["event"], "candidates")
+        self.assertEqual(self.gemini.calls, 0)  # Sent before ranking started
+        self.assertEqual(json.loads(await anext(events))["event"], "ranked")
+
+
+class AsyncSearchTests(SearchTestCase):
+    url = "/api/maps/search_places_async/"
+
+    @override_settings(PLACES_CATALOG_ENABLED=True)
+    async def test_catalog_failures_do_not_drop_places_results(self):
+        locked = OperationalError("database is locked")
+        with mock.patch("map.catalog.load_cell", side_effect=locked), \
+                mock.patch("map.catalog.store_cell", side_effect=locked), \
+                self.assertLogs("map.views", "WARNING") as logs:
+            response = await self.async_client.post(self.url, SEARCH, content_type="application/json")
+        self.assertEqual(response.json()["count"], 10)
+        self.assertIn("Catalog store failed", "\n".join(logs.output))
+
+    async def test_genai_client_close_tolerates_other_sdk_versions(self):
+        await async_views._close_genai_client(object())
+        http_client = mock.AsyncMock()
+        await async_views._close_genai_client(mock.Mock(_api_client=mock.Mock(_async_httpx_client=http_client)))
+        http_client.aclose.assert_awaited_once()
+
+    async def test_search(self):
+        response = await self.async_client.post(self.url, SEARCH, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["restaurants"][0]["description"], "Ranked by the stub")
+
+    async def test_authenticated_search(self):
+        token = (await sync_to_async(RefreshToken.for_user)(self.user)).access_token
+        response = await self.async_client.post(
+            self.url, SEARCH, content_type="application/json",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response.json()["suggestion_id"]["user"], "eater")
+
+    async def test_rejects_bad_tokens(self):
+        response = await self.async_client.post(
+            self.url, SEARCH, content_type="application/json", headers={"Authorization": "Bearer nope"}
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class CatalogTests(QueryBudgetMixin, TestCase):
+    def test_store_and_load_a_cell(self):
+        restaurants = [
+            {"place_id": f"p{i}", "name": f"Restaurant {i}", "types": [], "photos": []}
+            for i in range(20)
+        ]
+        # Two upserts and a lookup (plus savepoints), however many places the cell holds
+        self.assertMaxQueries(9, lambda: catalog.store_cell("key", 14.555, 121.024, "ramen", 2000, restaurants))
+        self.assertMaxQueries(9, lambda: catalog.store_cell("other", 14.555, 121.024, "food", 2000, restaurants[:5]))
+        self.assertEqual(Place.objects.count(), 20)
+
+        loaded, date_refreshed = self.assertMaxQueries(2, lambda: catalog.load_cell("key"))
+        self.assertEqual([restaurant["place_id"] for restaurant in loaded], [f"p{i}" for i in range(20)])
+        self.assertTrue(catalog.is_fresh(date_refreshed))
+
+    def test_nearby_places_come_from_the_cells_around_a_point(self):
+        catalog.store_cell("key", 14.555, 121.024, "ramen", 2000, [
+            {"place_id": "here", "lat": 14.5551, "lng": 121.0241},
+            {"place_id": "next-cell", "lat": 14.566, "lng": 121.0241},  # ~1.2km north
+            {"place_id": "too-far", "lat": 14.6, "lng": 121.0241},  # ~5km north
+            {"place_id": "unlocated"},
+        ])
+        self.assertEqual(Place.objects.get(place_id="next-cell").geocell, "14.57:121.02")
+
+        nearby = self.assertMaxQueries(1, lambda: catalog.nearby_places(14.555, 121.024, 2000, 10))
+        self.assertEqual([restaurant["place_id"] for restaurant in nearby], ["here", "next-cell"])
+
+
+class PlacesSearchTests(SimpleTestCase):
+    TIERS = ["ramen halal restaurant ph", "ramen restaurant ph", "restaurant ph"]
+    PREFERENCES = {"food_preference": "ramen", "dietary_preference": "halal"}
+
+    def fetch(self, places):
+        with places.patch(), mock.patch("map.views.time.sleep") as sleep:
+            restaurants, cacheable = views.fetch_from_places("ramen", 14.55, 121.02, 2000, {})
+        return restaurants, cacheable, [c.args[0] for c in sleep.call_args_list]
+
+    def test_retries_a_page_token_until_it_is_ready(self):
+        places = FakePlaces(per_query=10, pages=2, not_ready=2)
+        restaurants, cacheable, delays = self.fetch(places)
+        self.assertEqual(len(restaurants), 20)
+        self.assertTrue(cacheable)
+        self.assertEqual(len(places.calls), 4)
+        self.assertEqual(delays, list(views.PAGE_TOKEN_RETRY_DELAYS[:2]))
+
+    def test_stops_paging_when_the_token_never_becomes_ready(self):
+        places = FakePlaces(per_query=10, pages=2, not_ready=10)
+        with self.assertLogs("map.views", "WARNING"):
+            restaurants, _, delays = self.fetch(places)
+        self.assertEqual(len(restaurants), 10)
+        self.assertEqual(len(places.calls), 2 + len(views.PAGE_TOKEN_RETRY_DELAYS))
+        self.assertEqual(delays, list(views.PAGE_TOKEN_RETRY_DELAYS))
+
+    def test_async_retries_a_page_token_until_it_is_ready(self):
+        places = FakePlaces(per_query=10, pages=2, not_ready=1)
+        with places.patch(), mock.patch("map.async_views.asyncio.sleep") as sleep:
+            restaurants, cacheable = asyncio.run(async_views.fetch_from_places("ramen", 14.55, 121.02, 2000, {}))
+        self.assertEqual(len(restaurants), 20)
+        self.assertTrue(cacheable)
+        sleep.assert_awaited_once_with(views.PAGE_TOKEN_RETRY_DELAYS[0])
+
+    def tier_results(self, first_tier_size: int) -> dict:
+        sizes = [first_tier_size, 10, 10]
+        return {
+            tier: [{"place_id": f"{tier}-{i}", "name": f"{tier} {i}"} for i in range(size)]
+            for tier, size in zip(self.TIERS, sizes)
+        }
+
+    def test_later_tiers_are_skipped_once_there_are_enough_results(self):
+        results = self.tier_results(views.MIN_RESULTS_BEFORE_FALLBACK)
+        with mock.patch("map.views.fetch_text_search_in_pool", side_effect=lambda query, *args: results[query]):
+            restaurants = views.search_restaurants(14.55, 121.02, {}, self.PREFERENCES)
+        self.assertEqual(restaurants, results[self.TIERS[0]])
+
+        async def fetch(query, *args):
+            return results[query]
+
+        with mock.patch("map.async_views.fetch_text_search", side_effect=fetch):
+            restaurants = asyncio.run(async_views.search_restaurants(14.55, 121.02, {}, self.PREFERENCES))
+        self.assertEqual(restaurants, results[self.TIERS[0]])
+
+    def test_broader_tiers_fill_in_below_the_minimum(self):
+        results = self.tier_results(views.MIN_RESULTS_BEFORE_FALLBACK - 1)
+        with mock.patch("map.views.fetch_text_search_in_pool", side_effect=lambda query, *args: results[query]):
+            restaurants = views.search_restaurants(14.55, 121.02, {}, self.PREFERENCES)
+        self.assertEqual(restaurants, results[self.TIERS[0]] + results[self.TIERS[1]])
+
+class RankingTests(TestCase):
+    def test_prefers_matching_places_within_budget(self):
+        restaurants = [
+            {"name": "Steakhouse", "price_level": 4, "rating": 4.9, "user_ratings_total": 900, "types": ["steak_house"]},
+            {"name": "Ramen Bar", "price_level": 2, "rating": 4.3, "user_ratings_total": 300, "types": ["ramen_restaurant"]},
+            {"name": "Cafe", "price_level": 1, "rating": 5.0, "user_ratings_total": 1, "types": ["cafe"]},
+        ]
+        ranked = rank_candidates(restaurants, {"food_preference": "ramen", "price": 300})
+        self.assertEqual(ranked[0]["name"], "Ramen Bar")
+
+
+
+class ParseRankingResponseTests(SimpleTestCase):
+    preferences = {"food_preference": "ramen", "dietary_preference": "none"}
+
+    def setUp(self):
+        self.shortlist = [{"name": f"Place {i}", "address": f"{i} Street", "types": ["restaurant"]} for i in range(1, 13)]
+
+    def parse(self, ranking):
+        return parse_ranking_response(json.dumps(ranking), self.shortlist, self.preferences)
+
+    def test_unknown_ids_are_filled_from_the_shortlist(self):
+        ranked = self.parse([
+            {"id": 3, "rank": 1, "description": "Good", "reason": "Ramen"},
+            {"id": 99, "rank": 2, "description": "Made up", "reason": "?"},
+            {"id": "1", "rank": 3, "description": "Not an id", "reason": "?"},
+        ])
+        self.assertEqual([r["name"] for r in ranked], ["Place 3", "Place 1", "Place 2", "Place 4", "Place 5",
+                                                       "Place 6", "Place 7", "Place 8", "Place 9", "Place 10"])
+        self.assertEqual([r["rank"] for r in ranked], list(range(1, 11)))
+        self.assertEqual(ranked[0]["description"], "Good")
+        self.assertEqual(ranked[1]["description"], "A Restaurant in 1 Street.")
+        self.assertIn("ramen", ranked[1]["recommendation_reason"])
+
+    def test_duplicate_ids_keep_the_first_and_fill_the_rest(self):
+        ranked = self.parse([{"id": 2, "rank": 1, "description": "First"}, {"id": 2, "rank": 2, "description": "Again"}])
+        self.assertEqual([r["name"] for r in ranked][:3], ["Place 2", "Place 1", "Place 3"])
+        self.assertEqual(ranked[0]["description"], "First")
+        self.assertEqual(len({r["name"] for r in ranked}), 10)
+
+    def test_short_shortlists_are_not_padded(self):
+        self.shortlist = self.shortlist[:3]
+        ranked = self.parse([{"id": 3, "rank": 1}])
+        self.assertEqual([r["name"] for r in ranked], ["Place 3", "Place 1", "Place 2"])
+
+    def test_non_list_output_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.parse({"id": 1, "rank": 1})
+
+    def test_empty_output_is_rejected(self):
+        for text in ("", "[]", json.dumps([{"id": 99, "rank": 1}])):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_ranking_response(text, self.shortlist, self.preferences)
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        self.flight = SingleFlight("shared", "test-flight", lock_ttl=5, result_ttl=5, wait_timeout=0.3, poll_interval=0.01)
+
+    def wait_for_followers(self, count: int):
+        deadline = time.monotonic() + 5
+        while self.flight.stats.snapshot()["followers"] < count:
+            self.assertLess(time.monotonic(), deadline, "Followers never arrived")
+            time.sleep(0.005)
+
+    def run_with_followers(self, fn, followers: int = 3) -> list:
+        """Run do() on a leader thread and `followers` more once it holds the key; returns their outcomes."""
+        release = threading.Event()
+        calls = []
+
+        def leader_fn():
+            calls.append(1)
+            release.wait(5)
+            return fn()
+
+        def call():
+            try:
+                return self.flight.do("key", leader_fn)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=followers + 1) as pool:
+            leader = pool.submit(call)
+            while not calls:
+                time.sleep(0.005)
+            others = [pool.submit(call) for _ in range(followers)]
+            self.wait_for_followers(followers)
+            release.set()
+            outcomes = [leader.result()] + [future.result() for future in others]
+        self.assertEqual(len(calls), 1)
+        return outcomes
+
+    def test_concurrent_calls_share_one_execution(self):
+        self.assertEqual(self.run_with_followers(lambda: "result"), ["result"] * 4)
+
+    def test_followers_get_the_leaders_error(self):
+        error = ValueError("upstream failed")
+
+        def fail():
+            raise error
+
+        self.assertEqual(self.run_with_followers(fail), [error] * 4)
+        self.assertIsNone(caches["shared"].get("test-flight:lock:key"))
+
+    def test_waits_for_another_workers_result(self):
+        caches["shared"].add("test-flight:lock:key", 1)  # Held by another worker
+        threading.Timer(0.05, lambda: caches["shared"].set("test-flight:result:key", "shared")).start()
+        self.assertEqual(self.flight.do("key", lambda: "own"), "shared")
+        self.assertEqual(self.flight.stats.snapshot()["shared_hits"], 1)
+
+    def test_runs_itself_when_another_worker_is_too_slow(self):
+        caches["shared"].add("test-flight:lock:key", 1)
+        self.assertEqual(self.flight.do("key", lambda: "own"), "own")
+        self.assertEqual(self.flight.stats.snapshot()["wait_timeouts"], 1)
+
+    async def test_async_calls_share_one_execution(self):
+        release = asyncio.Event()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        tasks = [asyncio.create_task(self.flight.ado("key", fn)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        self.assertEqual(await asyncio.gather(*tasks), ["result"] * 3)
+        self.assertEqual(len(calls), 1)
+
+    async def test_followers_take_over_from_a_cancelled_leader(self):
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        async def answer():
+            return "result"
+
+        leader = asyncio.create_task(self.flight.ado("key", hang))
+        await started.wait()
+        follower = asyncio.create_task(self.flight.ado("key", answer))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        self.assertEqual(await asyncio.wait_for(follower, 1), "result")
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
@@ -1,6 +1,9 @@
-from .views import nearby_restaurants
+from .views import nearby_restaurants, nearby_restaurants_stream
+from .async_views import nearby_restaurants_async
 from django.urls import path
 
 urlpatterns = [
     path('search_places/', nearby_restaurants,name="nearby restaurants"),
+    path('search_places_async/', nearby_restaurants_async, name="nearby restaurants async"),
+    path('search_places_stream/', nearby_restaurants_stream, name="nearby restaurants stream"),
 ]
\ No newline at end of file
@@ -1,13 +1,31 @@
 import os
-import requests
 import time
 import json
-from rest_framework.decorators import api_view
+import threading
+import functools
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
+import google.auth
 from google import genai
 from google.genai import types
-from suggestions.models import Prompt, Location, Suggestion
+from suggestions.prompts import get_or_create_prompt
+from visited import cache as visited_cache
+from django.conf import settings
+from django.db import close_old_connections
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from weats_backend import instrumentation
+from weats_backend.instrumentation import stage, timed
+from weats_backend.upstream import get_session
+from . import catalog
+from .cache import places_cache, ranking_cache, geocell, normalize_query, Counters
+from .ranking import preference_price_level, rank_candidates
+from .streaming import EventStreamRenderer, NDJSONRenderer, format_event
+from .singleflight import SingleFlight
 
 vertex_location = os.getenv("VERTEX_LOCATION", "us-central1")  # Default to us-central1 if not set
 project_id = os.getenv("VERTEX_PROJECT_ID")
@@ -15,17 +33,67 @@ use_vertex = os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "True")
 GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
 MAX_SEARCH_RESULTS = 50  # Get more results for filtering
 MAX_FINAL_RESULTS = 10   # Final number of recommendations
+LLM_SHORTLIST_SIZE = 20  # Candidates sent to Gemini for re-ranking
 SEARCH_RADIUS = 2000  # Increased radius to compensate for single search
-PLACES_API_URL = "https://places.googleapis.com/v1/places:searchText"
+MIN_RESULTS_BEFORE_FALLBACK = 10  # Use broader queries only below this many results
+PAGE_TOKEN_RETRY_DELAYS = (0.2, 0.4, 0.8)  # Backoff while a fresh page token is not ready
 PLACES_PHOTO_URL = "https://places.googleapis.com/v1/{photo_name}/media"
 
-# Initialize Vertex AI client
-client = genai.Client(
-    vertexai=True,
-    project=project_id,
-    location=vertex_location,
+logger = logging.getLogger(__name__)
+
+RANKING_MODEL = "gemini-2.5-pro-preview-05-06"
+
+@functools.lru_cache(maxsize=None)
+def vertex_credentials():
+    """Application default credentials, loaded once and shared by every client."""
+    credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    return credentials
+
+def make_genai_client():
+    """A new Vertex AI client. Its async half is bound to the first event loop it runs on."""
+    http_options = types.HttpOptions(
+        base_url=settings.GENAI_BASE_URL,
+        timeout=int(settings.UPSTREAM_LLM_TIMEOUT * 1000),  # milliseconds
+    )
+    if settings.GENAI_API_KEY:
+        # Gemini API with a key instead of Vertex AI, e.g. against a local stand-in
+        return genai.Client(api_key=settings.GENAI_API_KEY, http_options=http_options)
+    return genai.Client(
+        vertexai=True,
+        credentials=vertex_credentials(),
+        project=project_id,
+        location=vertex_location,
+        http_options=http_options,
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_genai_client():
+    """Client for sync code, created on first use so importing the app needs no credentials."""
+    return make_genai_client()
+
+# Shared pool for running the query tiers of a search in parallel
+search_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="places-search")
+
+# Gemini calls run here so a search can stop waiting once its latency budget is spent
+ranking_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="vertex-ranking")
+# Gemini calls running or queued (sync and async); past this searches rank locally instead of queueing
+ranking_slots = threading.BoundedSemaphore(settings.RANKING_MAX_IN_FLIGHT)
+ranking_stats = Counters("llm_calls", "llm_errors", "budget_exceeded", "busy")
+
+# Coalesces identical concurrent searches within and across workers
+search_flight = SingleFlight(
+    alias="shared",
+    prefix="search:flight",
+    lock_ttl=settings.SINGLEFLIGHT_LOCK_TTL,
+    result_ttl=settings.SINGLEFLIGHT_RESULT_TTL,
+    wait_timeout=settings.SINGLEFLIGHT_WAIT_TIMEOUT,
 )
 
+instrumentation.register_counters("weats_places_cache", places_cache.stats)
+instrumentation.register_counters("weats_ranking_cache", ranking_cache.stats)
+instrumentation.register_counters("weats_ranking", ranking_stats)
+instrumentation.register_counters("weats_search_flight", search_flight.stats)
+
 def get_photo_url(photo_name, max_width=400, max_height=400):
     """Get the URL for a place photo."""
     if not photo_name:
@@ -39,64 +107,72 @@ def get_photo_url(photo_name, max_width=400, max_height=400):
     }
     return f"{url}?{'&'.join(f'{k}={v}' for k, v in params.items())}"
 
-def get_or_create_prompt(data):
-    # Set default values for required fields
-    price = data.get('max_price', 0)  # Default to 0 if not provided
-    food_preference = data.get('food_preference', 'any')
-    dietary_preference = data.get('dietary_preference', 'any')
-    lat = data.get('lat', 0.0)
-    lng = data.get('lng', 0.0)
-
-    prompt, created = Prompt.objects.get_or_create(
-        price=price,
-        food_preference=food_preference,
-        dietary_preference=dietary_preference,
-        lat=lat,
-        lng=lng
+def apply_default_ranking(restaurants: list, preferences: dict) -> list:
+    """Rank restaurants in their current order with template descriptions."""
+    for i, restaurant in enumerate(restaurants, 1):
+        place_type = (restaurant.get('types') or ['restaurant'])[0]
+        restaurant["description"] = f"A {place_type.replace('_', ' ').title()} in {restaurant.get('address', 'the area')}."
+        restaurant["recommendation_reason"] = f"Selected based on your preferences for {preferences.get('food_preference', 'any cuisine')} and {preferences.get('dietary_preference', 'any dietary preference')}."
+        restaurant["rank"] = i
+    return restaurants
+
+def ranking_cache_key(restaurants: list, preferences: dict) -> str:
+    """Cache key for a ranking: the candidate set plus the preferences the model sees."""
+    identities = sorted(str(place_identity(restaurant)) for restaurant in restaurants)
+    return ranking_cache.make_key(
+        identities,
+        normalize_query(preferences.get("food_preference", "Surprise me, Choosee!")),
+        normalize_query(preferences.get("dietary_preference", "Not choosy atm!")),
+        preference_price_level(preferences),
     )
-    return prompt
 
-def filter_restaurants_with_vertex(restaurants: list, preferences: dict) -> list:
-    """Filter restaurants using Vertex AI Gemini model based on user preferences."""
-    try:
-        if len(restaurants) <= MAX_FINAL_RESULTS:
-            for i, restaurant in enumerate(restaurants, 1):
-                restaurant["description"] = f"A {restaurant.get('types', ['restaurant'])[0].replace('_', ' ').title()} in {restaurant.get('address', 'the area')}."
-                restaurant["recommendation_reason"] = f"Selected based on your preferences for {preferences.get('food_preference', 'any cuisine')} and {preferences.get('dietary_preference', 'any dietary preference')}."
-                restaurant["rank"] = i
-            return restaurants
+# Place types that say nothing about the cuisine
+GENERIC_PLACE_TYPES = {"restaurant", "food", "point_of_interest", "establishment"}
+
+# Structured output: the model only returns candidate IDs and its own text
+RANKING_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=types.Schema(
+        type=types.Type.ARRAY,
+        items=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "id": types.Schema(type=types.Type.INTEGER),
+                "rank": types.Schema(type=types.Type.INTEGER),
+                "description": types.Schema(type=types.Type.STRING),
+                "reason": types.Schema(type=types.Type.STRING),
+            },
+            required=["id", "rank", "description", "reason"],
+        ),
+    ),
+)
 
-        # Extract preferences
-        food_preference = preferences.get("food_preference", "Surprise me, Choosee!")
-        dietary_pref = preferences.get("dietary_preference", "Not choosy atm!")
-        
-        def map_price_to_level(peso):
-            if peso <= 0:
-                return 0
-            elif peso <= 150:
-                return 1
-            elif peso <= 300:
-                return 2
-            elif peso <= 600:
-                return 3
-            else:
-                return 4
-
-        # Map string levels from the restaurant data
-        STRING_TO_LEVEL = {
-            "PRICE_LEVEL_FREE": 0,
-            "PRICE_LEVEL_INEXPENSIVE": 1,
-            "PRICE_LEVEL_MODERATE": 2,
-            "PRICE_LEVEL_EXPENSIVE": 3,
-            "PRICE_LEVEL_VERY_EXPENSIVE": 4
+def encode_candidates(restaurants: list) -> str:
+    """
+    Compact JSON for the ranking prompt. Candidates are referred to by their
+    1-based position and only carry the fields the ranking criteria use.
+    """
+    candidates = []
+    for candidate_id, restaurant in enumerate(restaurants, 1):
+        candidate = {
+            "id": candidate_id,
+            "name": restaurant.get("name"),
+            "types": [t for t in restaurant.get("types") or [] if t not in GENERIC_PLACE_TYPES],
+            "price": restaurant.get("price_level"),
+            "rating": restaurant.get("rating"),
+            "reviews": restaurant.get("user_ratings_total"),
         }
+        candidates.append({key: value for key, value in candidate.items() if value not in (None, [])})
+    return json.dumps(candidates, separators=(",", ":"), ensure_ascii=False)
 
-        # Convert preference price (in pesos) to price level
-        raw_price = preferences.get("price", 1000)
-        price = map_price_to_level(raw_price) if isinstance(raw_price, (int, float)) else 4
+def build_ranking_prompt(restaurants: list, preferences: dict) -> str:
+    """Build the Gemini prompt asking for the top restaurants for these preferences."""
+    # Extract preferences
+    food_preference = preferences.get("food_preference", "Surprise me, Choosee!")
+    dietary_pref = preferences.get("dietary_preference", "Not choosy atm!")
+    price = preference_price_level(preferences)
 
-        # Construct prompt
-        prompt = f"""
+    return f"""
 You are a restaurant recommendation engine. Your task is to analyze a list of restaurants and select the TOP 10 that best match the user's preferences.
 
 ## User Preferences
@@ -105,7 +181,8 @@ You are a restaurant recommendation engine. Your task is to analyze a list of re
 - Max Price Level: {price} (1=budget, 2=moderate, 3=expensive, 4=very expensive)
 
 ## Restaurant Candidates
-{json.dumps(restaurants, indent=2)}
+Fields: id, name, types (Google place types), price (price level), rating, reviews (number of ratings).
+{encode_candidates(restaurants)}
 
 ## Ranking Criteria (in priority order)
 1. Price level must be within or below the user's budget.
@@ -115,273 +192,599 @@ You are a restaurant recommendation engine. Your task is to analyze a list of re
 5. General quality and reputation.
 
 ## Output Format
-Return a **JSON array of exactly 10 restaurants**, ranked from best match (rank=1) to least match (rank=10).  
-Each restaurant must preserve its original fields and include the following additional keys:
-- "description": A short, engaging summary of the restaurant (1–2 sentences).
-- "recommendation_reason": A specific explanation of why this restaurant was selected.
+Return exactly 10 candidates, ranked from best match (rank=1) to least match (rank=10), each with:
+- "id": The candidate id.
 - "rank": An integer from 1 to 10 (1 = best match).
-
-**Only output the final JSON array. Do not include any explanations, markdown, or additional text.**
+- "description": A short, engaging summary of the restaurant (1–2 sentences).
+- "reason": A specific explanation of why this restaurant was selected.
 """
 
-        print(preferences)
+def parse_ranking_response(text: str, restaurants: list, preferences: dict) -> list:
+    """
+    Parse a structured Gemini ranking and join it back onto the candidate
+    records. Slots left by unknown or repeated ids are filled from the
+    (locally ranked) candidates in order, with the default descriptions.
+    """
+    if not text:
+        raise ValueError("Empty response from Vertex AI")
+
+    ranking = json.loads(text)
+
+    # Validate the response structure
+    if not isinstance(ranking, list):
+        raise ValueError(f"Expected list but got {type(ranking)}")
+
+    ranked = []
+    used_ids = set()
+    items = [item for item in ranking if isinstance(item, dict)]
+    for item in sorted(items, key=lambda x: x.get("rank", MAX_FINAL_RESULTS)):
+        candidate_id = item.get("id")
+        if not isinstance(candidate_id, int) or not 1 <= candidate_id <= len(restaurants) or candidate_id in used_ids:
+            continue
+        used_ids.add(candidate_id)
+
+        restaurant = dict(restaurants[candidate_id - 1])
+        restaurant["description"] = item.get("description", "")
+        restaurant["recommendation_reason"] = item.get("reason", "")
+        restaurant["rank"] = len(ranked) + 1
+        ranked.append(restaurant)
+        if len(ranked) >= MAX_FINAL_RESULTS:
+            break
 
-        # Send request to Vertex AI
-        response = client.models.generate_content(
-            model="gemini-2.5-pro-preview-05-06",
-            contents=prompt
-        )
+    if not ranked:
+        raise ValueError("Vertex AI ranking did not reference any candidates")
+
+    unused = [dict(restaurant) for i, restaurant in enumerate(restaurants, 1) if i not in used_ids]
+    for restaurant in apply_default_ranking(unused[:MAX_FINAL_RESULTS - len(ranked)], preferences):
+        restaurant["rank"] = len(ranked) + 1
+        ranked.append(restaurant)
+    return ranked
+
+def rank_locally(restaurants: list, preferences: dict) -> list:
+    """The local top results, the answer whenever Gemini does not give one."""
+    return apply_default_ranking(restaurants[:MAX_FINAL_RESULTS], preferences)
+
+def ranking_shortlist(restaurants: list, preferences: dict) -> tuple:
+    """Returns (shortlist, cache key): the model only sees the best candidates by local score."""
+    shortlist = restaurants[:LLM_SHORTLIST_SIZE]
+    return shortlist, ranking_cache_key(shortlist, preferences)
+
+def ranking_busy(restaurants: list, preferences: dict) -> list:
+    ranking_stats.incr("busy")
+    logger.warning("Too many Vertex AI rankings in flight, using local ranking")
+    return rank_locally(restaurants, preferences)
+
+def ranking_over_budget(restaurants: list, preferences: dict) -> list:
+    ranking_stats.incr("budget_exceeded")
+    logger.warning("Vertex AI ranking exceeded its latency budget, using local ranking",
+                   extra={"budget": settings.RANKING_LATENCY_BUDGET})
+    return rank_locally(restaurants, preferences)
+
+def ranking_failed(e: Exception, restaurants: list, preferences: dict) -> list:
+    logger.warning("Vertex AI ranking failed, using local ranking", exc_info=e)
+    return rank_locally(restaurants, preferences)
+
+def rank_with_vertex(shortlist: list, preferences: dict, cache_key: str) -> list:
+    """
+    Ask Gemini to rank the shortlist and cache the result. The cache is
+    filled even when the caller has stopped waiting, so the next identical
+    search gets the model's answer.
+    """
+    ranking_stats.incr("llm_calls")
+    try:
+        with stage("llm"):
+            response = get_genai_client().models.generate_content(
+                model=RANKING_MODEL,
+                contents=build_ranking_prompt(shortlist, preferences),
+                config=RANKING_CONFIG
+            )
+        filtered_restaurants = parse_ranking_response(response.text, shortlist, preferences)
+    except Exception:
+        ranking_stats.incr("llm_errors")
+        raise
+    ranking_cache.set(cache_key, filtered_restaurants)
+    return filtered_restaurants
+
+def rank_in_slot(*args) -> list:
+    """rank_with_vertex() for the ranking executor, freeing the slot it was submitted with."""
+    try:
+        return rank_with_vertex(*args)
+    finally:
+        ranking_slots.release()
 
-        # Log the raw response for debugging
-        print(f"Raw Vertex AI response: {response.text}")
+@timed("ranking")
+def filter_restaurants_with_vertex(restaurants: list, preferences: dict) -> list:
+    """
+    Filter restaurants using Vertex AI Gemini model based on user preferences.
+    Expects the restaurants in local ranking order (see ranking.rank_candidates),
+    which is also the answer when Gemini fails or exceeds RANKING_LATENCY_BUDGET.
+    """
+    if len(restaurants) <= MAX_FINAL_RESULTS:
+        return apply_default_ranking(restaurants, preferences)
+
+    shortlist, cache_key = ranking_shortlist(restaurants, preferences)
+    cached = ranking_cache.get(cache_key)
+    if cached:
+        logger.debug("Ranking cache hit")
+        return cached
+
+    if not ranking_slots.acquire(blocking=False):
+        return ranking_busy(restaurants, preferences)
+
+    # Send request to Vertex AI
+    future = instrumentation.submit(ranking_executor, rank_in_slot, shortlist, preferences, cache_key)
+    try:
+        return future.result(timeout=settings.RANKING_LATENCY_BUDGET)
 
-        # Parse the response
-        content = response.text.strip()
-        
-        # Handle potential markdown formatting
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-        
-        # Clean up any potential whitespace
-        content = content.strip()
-        
-        # Log the cleaned content for debugging
-        print(f"Cleaned content before JSON parsing: {content}")
+    except FuturesTimeoutError:
+        # A call still waiting for a worker is dropped; a running one finishes and fills the cache
+        if future.cancel():
+            ranking_slots.release()
+        return ranking_over_budget(restaurants, preferences)
+
+    except Exception as e:
+        return ranking_failed(e, restaurants, preferences)
+
+PRICE_LEVEL_MAP = {
+    "PRICE_LEVEL_FREE": 0,
+    "PRICE_LEVEL_INEXPENSIVE": 1,
+    "PRICE_LEVEL_MODERATE": 2,
+    "PRICE_LEVEL_EXPENSIVE": 3,
+    "PRICE_LEVEL_VERY_EXPENSIVE": 4
+}
+
+def build_text_queries(preferences: dict) -> list:
+    """Build the text queries to try, from most to least specific."""
+    cuisine = preferences.get("food_preference", "")
+    dietary = preferences.get("dietary_preference", "")
+    return [
+        # First attempt: Try specific cuisine and dietary preference
+        f"{cuisine} {dietary} restaurant PH" if cuisine or dietary else "restaurant PH",
+        # Second attempt: Try just cuisine type
+        f"{cuisine} restaurant PH" if cuisine else "restaurant PH",
+        # Final attempt: General restaurant search
+        "restaurant PH",
+    ]
+
+def parse_place(place: dict) -> dict:
+    """Convert a Places API result into our restaurant dict."""
+    raw_price_level = place.get("priceLevel")
+    return {
+        "place_id": place.get("id"),
+        "name": place.get("displayName", {}).get("text"),
+        "address": place.get("formattedAddress"),
+        "lat": place.get("location", {}).get("latitude"),
+        "lng": place.get("location", {}).get("longitude"),
+        "rating": place.get("rating"),
+        "user_ratings_total": place.get("userRatingCount"),
+        "price_level": PRICE_LEVEL_MAP.get(raw_price_level, None),
+        "types": place.get("types", []),
+        "photos": place.get("photos", [])
+    }
 
-        if not content:
-            raise ValueError("Empty response from Vertex AI")
+def place_identity(restaurant: dict):
+    """Key used to tell whether two results are the same place."""
+    return restaurant.get("place_id") or (restaurant.get("name"), restaurant.get("address"))
+
+def text_search_tiers(preferences: dict) -> list:
+    """The distinct normalized text queries of a search, most specific first."""
+    return list(dict.fromkeys(normalize_query(q) for q in build_text_queries(preferences)))
+
+def merge_results(restaurants: list, seen: set, results: list):
+    """Append results not already seen, stopping at MAX_SEARCH_RESULTS."""
+    for restaurant in results:
+        identity = place_identity(restaurant)
+        if identity in seen:
+            continue
+        seen.add(identity)
+        restaurants.append(restaurant)
+        if len(restaurants) >= MAX_SEARCH_RESULTS:
+            break
 
-        try:
-            filtered_restaurants = json.loads(content)
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {str(e)}")
-            print(f"Content that failed to parse: {content}")
-            raise
-
-        # Validate the response structure
-        if not isinstance(filtered_restaurants, list):
-            raise ValueError(f"Expected list but got {type(filtered_restaurants)}")
-        
-        if len(filtered_restaurants) > MAX_FINAL_RESULTS:
-            filtered_restaurants = filtered_restaurants[:MAX_FINAL_RESULTS]
+def merge_tier(restaurants: list, seen: set, results: list) -> bool:
+    """Merge one tier's results. Returns True once broader tiers are no longer needed."""
+    merge_results(restaurants, seen, results)
+    return len(restaurants) >= MIN_RESULTS_BEFORE_FALLBACK
 
-        # Sort by rank and return
-        filtered_restaurants.sort(key=lambda x: x.get("rank", 10))
-        return filtered_restaurants
+def page_token_not_ready(response) -> bool:
+    """Places rejects a freshly issued page token with INVALID_ARGUMENT until it is usable."""
+    if response.status_code != 400:
+        return False
+    try:
+        return response.json().get("error", {}).get("status") == "INVALID_ARGUMENT"
+    except ValueError:
+        return False
+
+@timed("places")
+def post_places_search(body: dict, headers: dict):
+    """POST a text search, retrying a page token with short backoff while it is not ready."""
+    response = get_session().post(settings.PLACES_API_URL, headers=headers, json=body)
+    if "pageToken" in body:
+        for delay in PAGE_TOKEN_RETRY_DELAYS:
+            if not page_token_not_ready(response):
+                break
+            time.sleep(delay)
+            response = get_session().post(settings.PLACES_API_URL, headers=headers, json=body)
+    return response
+
+def places_search_body(text_query: str, cell_lat: float, cell_lng: float, radius: int,
+                       page_token: str = None) -> dict:
+    """Body for the first page of a text search, or for the page behind page_token."""
+    if page_token:
+        return {"pageToken": page_token}
+    # Search from the cell centre so everyone sharing the cache key gets the same results
+    return {
+        "textQuery": text_query,
+        "includedType": "restaurant",
+        "locationBias": {
+            "circle": {
+                "center": {"latitude": cell_lat, "longitude": cell_lng},
+                "radius": radius
+            }
+        },
+    }
 
-    except Exception as e:
-        print(f"Error in Vertex AI filtering: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        
-        # Fallback to basic filtering
-        for i, restaurant in enumerate(restaurants[:MAX_FINAL_RESULTS], 1):
-            restaurant["description"] = f"A {restaurant.get('types', ['restaurant'])[0].replace('_', ' ').title()} in {restaurant.get('address', 'the area')}."
-            restaurant["recommendation_reason"] = f"Selected based on your preferences for {preferences.get('food_preference', 'any cuisine')} and {preferences.get('dietary_preference', 'any dietary preference')}."
-            restaurant["rank"] = i
-        return restaurants[:MAX_FINAL_RESULTS]
+def read_places_page(response, text_query: str, restaurants: list):
+    """
+    Add the restaurants of a Places response to restaurants. Returns the
+    next page token, or None when this was the last page or an error.
+    """
+    if response.status_code != 200:
+        logger.warning("Places search returned an error", extra={
+            "query": text_query, "status": response.status_code, "body": response.text[:500]
+        })
+        return None
 
-def search_restaurants(lat: float, lng: float, headers: dict, preferences: dict) -> list:
-    """Search for restaurants in a specific area."""
+    data = response.json()
+    places = data.get("places", [])
+    logger.debug("Places page", extra={"query": text_query, "places": len(places)})
+    restaurants.extend(parse_place(place) for place in places)
+    return data.get("nextPageToken")
+
+def fetch_from_places(text_query: str, cell_lat: float, cell_lng: float, radius: int, headers: dict,
+                      stop_event: threading.Event = None) -> tuple:
+    """
+    Run a single Places text search and follow its pagination.
+    Returns (restaurants, cacheable); results are not cacheable when the
+    request failed or stop_event abandoned the remaining pages.
+    """
     restaurants = []
     page_token = None
-    search_attempt = 0
-    current_radius = SEARCH_RADIUS
-
-    PRICE_LEVEL_MAP = {
-        "PRICE_LEVEL_FREE": 0,
-        "PRICE_LEVEL_INEXPENSIVE": 1,
-        "PRICE_LEVEL_MODERATE": 2,
-        "PRICE_LEVEL_EXPENSIVE": 3,
-        "PRICE_LEVEL_VERY_EXPENSIVE": 4
-    }
-    
+
     while len(restaurants) < MAX_SEARCH_RESULTS:
-        if page_token:
-            body = {"pageToken": page_token}
-            time.sleep(2)  # Wait before using the token
-        else:
-            # Build text query based on search attempt
-            if search_attempt == 0:
-                # First attempt: Try specific cuisine and dietary preference
-                cuisine = preferences.get("food_preference", "")
-                dietary = preferences.get("dietary_preference", "")
-                text_query = f"{cuisine} {dietary} restaurant PH" if cuisine or dietary else "restaurant PH"
-            elif search_attempt == 1:
-                # Second attempt: Try just cuisine type
-                cuisine = preferences.get("food_preference", "")
-                text_query = f"{cuisine} restaurant PH" if cuisine else "restaurant PH"
-            else:
-                # Final attempt: General restaurant search
-                text_query = "restaurant PH"
-            
-            body = {
-                "textQuery": text_query,
-                "includedType": "restaurant",
-                "locationBias": {
-                    "circle": {
-                        "center": {"latitude": lat, "longitude": lng},
-                        "radius": current_radius
-                    }
-                },
-            }
-            print(f"Search attempt {search_attempt + 1} with query: {text_query}")
+        if stop_event is not None and stop_event.is_set():
+            return restaurants, False
 
+        body = places_search_body(text_query, cell_lat, cell_lng, radius, page_token)
         try:
-            response = requests.post(PLACES_API_URL, headers=headers, json=body)
-            print(f"Response status: {response.status_code}")
+            response = post_places_search(body, headers)
+        except Exception as e:
+            logger.warning("Places search failed", exc_info=e, extra={"query": text_query})
+            return restaurants, False
 
-            if response.status_code != 200:
-                print(f"Error in search: {response.text}")
-                break
+        page_token = read_places_page(response, text_query, restaurants)
+        if not page_token:
+            break
 
-            data = response.json()
-            places = data.get("places", [])
-            print(f"Found {len(places)} places in this page")
-
-            for place in places:
-                raw_price_level = place.get("priceLevel")
-                price_level = PRICE_LEVEL_MAP.get(raw_price_level, None)
-
-                restaurant = {
-                    "name": place.get("displayName", {}).get("text"),
-                    "address": place.get("formattedAddress"),
-                    "lat": place.get("location", {}).get("latitude"),
-                    "lng": place.get("location", {}).get("longitude"),
-                    "rating": place.get("rating"),
-                    "user_ratings_total": place.get("userRatingCount"),
-                    "price_level": price_level,
-                    "types": place.get("types", []),
-                    "photos": place.get("photos", [])
-                }
-                restaurants.append(restaurant)
-
-            page_token = data.get("nextPageToken")
-            if not page_token:
-                print("No more pages available")
-                # If we have less than 10 results, try next search attempt
-                if len(restaurants) < 10 and search_attempt < 2:
-                    search_attempt += 1
-                    page_token = None  # Reset page token for new search
-                    continue
-                break
+    return restaurants, True
+
+def text_search_key(text_query: str, lat: float, lng: float, radius: int, headers: dict) -> tuple:
+    """Returns (key, cell_lat, cell_lng, normalized query) identifying a text search."""
+    text_query = normalize_query(text_query)
+    cell_lat, cell_lng = geocell(lat, lng)
+    cache_key = places_cache.make_key(
+        cell_lat, cell_lng, text_query, radius, headers.get("X-Goog-FieldMask")
+    )
+    return cache_key, cell_lat, cell_lng, text_query
 
-            print(f"Total restaurants found: {len(restaurants)}")
-            
+def store_text_search(cache_key: str, text_query: str, cell_lat: float, cell_lng: float, radius: int,
+                      restaurants: list):
+    """Keep a complete Places answer in the cache and, when enabled, the catalog."""
+    places_cache.set(cache_key, restaurants)
+    if settings.PLACES_CATALOG_ENABLED:
+        try:
+            catalog.store_cell(cache_key, cell_lat, cell_lng, text_query, radius, restaurants)
         except Exception as e:
-            print(f"Error searching: {str(e)}")
-            break
-            
+            # The results are still good; only the catalog copy is lost
+            logger.warning("Catalog store failed", exc_info=e, extra={"query": text_query})
+
+def refresh_catalog_cell(cache_key: str, text_query: str, cell_lat: float, cell_lng: float, radius: int, headers: dict):
+    """Refetch a text search from Places and store it in the catalog and cache."""
+    restaurants, cacheable = fetch_from_places(text_query, cell_lat, cell_lng, radius, headers)
+    if cacheable:
+        store_text_search(cache_key, text_query, cell_lat, cell_lng, radius, restaurants)
+
+def lookup_catalog(cache_key: str, text_query: str, cell_lat: float, cell_lng: float, radius: int, headers: dict):
+    """
+    Answer a text search from the place catalog, or return None when Places
+    must be asked. Stale cells are served while they are refreshed in the
+    background.
+    """
+    try:
+        entry = catalog.load_cell(cache_key)
+    except Exception as e:
+        logger.warning("Catalog lookup failed", exc_info=e, extra={"query": text_query})
+        return None
+    if entry is None:
+        return None
+
+    restaurants, date_refreshed = entry
+    if catalog.is_fresh(date_refreshed):
+        logger.debug("Catalog hit", extra={"query": text_query})
+        places_cache.set(cache_key, restaurants)
+        return restaurants
+    if catalog.is_servable(date_refreshed):
+        logger.info("Stale catalog hit, refreshing", extra={"query": text_query})
+        catalog.schedule_refresh(cache_key, functools.partial(
+            refresh_catalog_cell, cache_key, text_query, cell_lat, cell_lng, radius, headers
+        ))
+        return restaurants
+    return None
+
+def fetch_text_search(text_query: str, lat: float, lng: float, radius: int, headers: dict,
+                      stop_event: threading.Event = None) -> list:
+    """
+    Answer a single Places text search, trying in order:
+    - the in-memory cache, per geocell, normalized query and radius; empty or
+      failed searches are negatively cached for a shorter TTL
+    - the place catalog in the database; stale cells are served while they
+      are refreshed in the background
+    - Places itself, storing the result in both of the above
+    Setting stop_event abandons the remaining pages without caching the partial result.
+    """
+    cache_key, cell_lat, cell_lng, text_query = text_search_key(text_query, lat, lng, radius, headers)
+    cached = places_cache.get(cache_key)
+    if cached is not None:
+        logger.debug("Places cache hit", extra={"query": text_query})
+        return cached
+
+    if settings.PLACES_CATALOG_ENABLED:
+        restaurants = lookup_catalog(cache_key, text_query, cell_lat, cell_lng, radius, headers)
+        if restaurants is not None:
+            return restaurants
+
+    restaurants, cacheable = fetch_from_places(text_query, cell_lat, cell_lng, radius, headers, stop_event)
+    if cacheable:
+        store_text_search(cache_key, text_query, cell_lat, cell_lng, radius, restaurants)
     return restaurants
 
-@api_view(['POST'])
-def nearby_restaurants(request):
-    print("Request data:", request.data)
-    lat = request.data.get("lat")
-    lng = request.data.get("lng")
-    preferences = request.data.get("preferences", {}) 
+def fetch_text_search_in_pool(*args) -> list:
+    """fetch_text_search for search_executor threads, which must not keep DB connections open."""
+    try:
+        return fetch_text_search(*args)
+    finally:
+        close_old_connections()
+
+@timed("search")
+def search_restaurants(lat: float, lng: float, headers: dict, preferences: dict) -> list:
+    """
+    Search for restaurants in a specific area.
+    All query tiers are started in parallel and merged in order of
+    specificity; broader tiers only contribute while we have fewer than
+    MIN_RESULTS_BEFORE_FALLBACK results, and duplicates are dropped.
+    """
+    text_queries = text_search_tiers(preferences)
+    stop_event = threading.Event()
+    futures = [
+        instrumentation.submit(
+            search_executor, fetch_text_search_in_pool, text_query, lat, lng, SEARCH_RADIUS, headers, stop_event
+        )
+        for text_query in text_queries
+    ]
+
+    restaurants = []
+    seen = set()
+    try:
+        for search_attempt, future in enumerate(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.warning("Places search failed", exc_info=e, extra={"query": text_queries[search_attempt]})
+                continue
+
+            if merge_tier(restaurants, seen, results):
+                break
+    finally:
+        # Abandon speculative tiers we no longer need
+        stop_event.set()
+        for future in futures:
+            future.cancel()
+
+    if not restaurants and settings.PLACES_CATALOG_ENABLED:
+        # Places had nothing for us (or failed); fall back to what earlier searches found nearby
+        restaurants = catalog.nearby_places(lat, lng, SEARCH_RADIUS, MAX_SEARCH_RESULTS)
+    return restaurants
+
+def parse_search_request(data) -> tuple:
+    """Validate a search request body. Returns (lat, lng, preferences, error)."""
+    lat = data.get("lat")
+    lng = data.get("lng")
+    preferences = data.get("preferences", {})
 
     if not lat or not lng:
-        return Response({"error": "Missing latitude or longitude"}, status=400)
+        return None, None, preferences, "Missing latitude or longitude"
 
     try:
         lat = float(lat)
         lng = float(lng)
-    except ValueError:
-        return Response({"error": "Latitude and longitude must be numbers"}, status=400)
+    except (TypeError, ValueError):
+        return None, None, preferences, "Latitude and longitude must be numbers"
 
-    headers = {
+    return lat, lng, preferences, None
+
+def places_headers() -> dict:
+    return {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": GOOGLE_PLACES_API_KEY,
         "X-Goog-FieldMask": (
-            "places.displayName,places.formattedAddress,places.location,"
+            "places.id,places.displayName,places.formattedAddress,places.location,"
             "places.rating,places.userRatingCount,places.priceLevel,places.types,"
             "places.photos"
         )
     }
 
+def prompt_data(lat: float, lng: float, preferences: dict) -> dict:
+    return {
+        "lat": lat,
+        "lng": lng,
+        "food_preference": preferences.get("food_preference", "any"),
+        "dietary_preference": preferences.get("dietary_preference", "any"),
+        "price": preferences.get("price", 0)
+    }
+
+def search_flight_key(lat: float, lng: float, preferences: dict) -> str:
+    """Searches in the same geocell with the same normalized preferences give the same result."""
+    cell_lat, cell_lng = geocell(lat, lng)
+    parts = (
+        cell_lat,
+        cell_lng,
+        bool(preferences),
+        normalize_query(preferences.get("food_preference", "")),
+        normalize_query(preferences.get("dietary_preference", "")),
+        preference_price_level(preferences),
+    )
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+def run_search_pipeline(lat: float, lng: float, preferences: dict) -> list:
+    """Search Places, rank locally and re-rank with Gemini when there are preferences."""
+    # Search for restaurants in the center location
+    all_restaurants = search_restaurants(lat, lng, places_headers(), preferences)
+
+    # Rank locally by budget fit, cuisine match and rating
+    all_restaurants = rank_candidates(all_restaurants, preferences)
+
+    # Filter restaurants based on preferences
+    if preferences:
+        return filter_restaurants_with_vertex(all_restaurants, preferences)
+    return all_restaurants[:MAX_FINAL_RESULTS]
+
+def build_location_dict(rest: dict) -> dict:
+    """Client-facing fields of a restaurant."""
+    photo_url = None
+    if rest.get("photos") and len(rest["photos"]) > 0:
+        photo_url = get_photo_url(rest["photos"][0].get("name"))
+
+    return {
+        "place_id": rest.get("place_id"),
+        "name": rest["name"],
+        "address": rest["address"],
+        "lat": rest["lat"],
+        "lng": rest["lng"],
+        "rating": rest.get("rating", 0),
+        "user_ratings_total": rest.get("user_ratings_total", 0),
+        "price_level": rest.get("price_level", 1),
+        "types": rest.get("types", []),
+        "description": rest.get("description", ""),
+        "recommendation_reason": rest.get("recommendation_reason", ""),
+        "photo_url": photo_url,
+    }
+
+@timed("serialize")
+def build_search_response(filtered_restaurants: list, prompt, user) -> dict:
+    """Build the response body for a finished search."""
+    location_dicts = [build_location_dict(rest) for rest in filtered_restaurants]
+
+    suggestion_data = {
+        "user": user.username if user is not None and user.is_authenticated else None,
+        "prompt": {
+            "lat": prompt.lat,
+            "lng": prompt.lng,
+            "food_preference": prompt.food_preference,
+            "dietary_preference": prompt.dietary_preference,
+            "price": prompt.price
+        },
+        "locations": location_dicts
+    }
+
+    return {
+        "prompt_id": prompt.id,
+        "suggestion_id": suggestion_data,
+        "restaurants": location_dicts,
+        "count": len(location_dicts)
+    }
+
+@timed("db")
+def annotate_visited(response: dict, user):
+    """Flag each restaurant of a search response with whether the user has visited it."""
+    flags = visited_cache.visited_flags(user, response["restaurants"])
+    response["restaurants"] = [
+        dict(restaurant, is_visited=flag) for restaurant, flag in zip(response["restaurants"], flags)
+    ]
+
+@api_view(['POST'])
+def nearby_restaurants(request):
+    lat, lng, preferences, error = parse_search_request(request.data)
+    if error:
+        return Response({"error": error}, status=400)
+
     try:
-        # Search for restaurants in the center location
-        all_restaurants = search_restaurants(lat, lng, headers, preferences)
-        
-        # Sort by rating
-        all_restaurants.sort(key=lambda x: x.get('rating', 0) or 0, reverse=True)
+        filtered_restaurants = search_flight.do(
+            search_flight_key(lat, lng, preferences),
+            lambda: run_search_pipeline(lat, lng, preferences)
+        )
+
+        prompt = get_or_create_prompt(prompt_data(lat, lng, preferences))
+
+        body = build_search_response(filtered_restaurants, prompt, request.user)
+        if request.data.get("include_visited") and request.user.is_authenticated:
+            annotate_visited(body, request.user)
+        return Response(body)
         
-        # Filter restaurants based on preferences
+    except Exception as e:
+        logger.exception("Search failed")
+        return Response({
+            "error": "Failed to fetch restaurants",
+            "details": str(e)
+        }, status=500)
+
+def stream_search_events(lat: float, lng: float, preferences: dict, user, media_type: str):
+    """
+    Yield the events of a streaming search: the locally ranked candidates as
+    soon as Places answers, then the final ranked response.
+    """
+    try:
+        all_restaurants = rank_candidates(search_restaurants(lat, lng, places_headers(), preferences), preferences)
+        candidates = [build_location_dict(rest) for rest in all_restaurants[:MAX_FINAL_RESULTS]]
+        yield format_event("candidates", {"restaurants": candidates, "count": len(candidates)}, media_type)
+
         if preferences:
             filtered_restaurants = filter_restaurants_with_vertex(all_restaurants, preferences)
         else:
             filtered_restaurants = all_restaurants[:MAX_FINAL_RESULTS]
-    
-        prompt = get_or_create_prompt({
-            "lat": lat,
-            "lng": lng,
-            "food_preference": preferences.get("food_preference", "any"),
-            "dietary_preference": preferences.get("dietary_preference", "any"),
-            "price": preferences.get("price", 0)
-        })
 
-        location_dicts = []
-        for rest in filtered_restaurants:
-            photo_url = None
-            if rest.get("photos") and len(rest["photos"]) > 0:
-                photo_url = get_photo_url(rest["photos"][0].get("name"))
-
-            location = Location(
-                name=rest["name"],
-                address=rest["address"],
-                lat=rest["lat"],
-                lng=rest["lng"],
-                rating=rest.get("rating", 0),
-                user_ratings_total=rest.get("user_ratings_total", 0),
-                price_level=rest.get("price_level", 1),
-                types=rest.get("types", []),
-                description=rest.get("description", ""),
-                recommendation_reason=rest.get("recommendation_reason", ""),
-                photo_url=photo_url
-            )
-
-            location_dicts.append({
-                "name": location.name,
-                "address": location.address,
-                "lat": location.lat,
-                "lng": location.lng,
-                "rating": location.rating,
-                "user_ratings_total": location.user_ratings_total,
-                "price_level": location.price_level,
-                "types": location.types,
-                "description": location.description,
-                "recommendation_reason": location.recommendation_reason,
-                "photo_url": photo_url,
-            })
-
-            print("MEOW: ", location.photo_url)
-
-        suggestion_data = {
-            "user": request.user.username if request.user.is_authenticated else None,
-            "prompt": {
-                "lat": prompt.lat,
-                "lng": prompt.lng,
-                "food_preference": prompt.food_preference,
-                "dietary_preference": prompt.dietary_preference,
-                "price": prompt.price
-            },
-            "locations": location_dicts
-        }
+        prompt = get_or_create_prompt(prompt_data(lat, lng, preferences))
+        yield format_event("ranked", build_search_response(filtered_restaurants, prompt, user), media_type)
 
-        return Response({
-            "prompt_id": prompt.id,
-            "suggestion_id": suggestion_data,
-            "restaurants": location_dicts,
-            "count": len(location_dicts)
-        })
-        
     except Exception as e:
-        print(f"Error: {str(e)}")
-        return Response({
+        logger.exception("Streaming search failed")
+        yield format_event("error", {
             "error": "Failed to fetch restaurants",
             "details": str(e)
-        }, status=500)
+        }, media_type)
+
+@api_view(['POST'])
+@renderer_classes([EventStreamRenderer, NDJSONRenderer])
+def nearby_restaurants_stream(request):
+    """
+    Streaming variant of nearby_restaurants. Sends a "candidates" event with
+    the local top results, then a "ranked" event with the same body as
+    search_places/. Server-Sent Events by default, NDJSON when the client
+    accepts application/x-ndjson.
+
+    Under ASGI the events come from an async generator, as Django would
+    buffer a sync one whole before sending it.
+    """
+    lat, lng, preferences, error = parse_search_request(request.data)
+    if error:
+        return Response({"error": error}, status=400)
+
+    media_type = request.accepted_renderer.media_type
+    if isinstance(request._request, ASGIRequest):
+        from . import async_views  # It imports this module
+        events = async_views.stream_search_events(lat, lng, preferences, request.user, media_type)
+    else:
+        events = stream_search_events(lat, lng, preferences, request.user, media_type)
+    response = StreamingHttpResponse(events, content_type=media_type)
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Stop nginx from buffering the stream
+    return response
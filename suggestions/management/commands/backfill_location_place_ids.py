@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from suggestions.models import Location
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in place_id for locations saved before it was required, as \"local:<location_hash>\". "
+        "Duplicates of a location that already has that key are left empty and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pending = Location.objects.filter(place_id__isnull=True).only("id", "name", "address")
+        filled = duplicates = 0
+        last_id = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id).order_by("id")[:options["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            keys = {location.id: Location.place_key(None, location.name, location.address) for location in batch}
+            taken = set(Location.objects.filter(place_id__in=keys.values()).values_list("place_id", flat=True))
+            updated = []
+            for location in batch:
+                key = keys[location.id]
+                if key in taken:
+                    duplicates += 1
+                    continue
+                taken.add(key)
+                location.place_id = key
+                updated.append(location)
+
+            Location.objects.bulk_update(updated, ["place_id"])
+            filled += len(updated)
+
+        self.stdout.write(f"Keyed {filled} locations; {duplicates} duplicates left without a place_id.")
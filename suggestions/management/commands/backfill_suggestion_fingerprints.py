@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from suggestions.models import Suggestion
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in locations_fingerprint for suggestions saved before it existed. "
+        "Duplicates of an already fingerprinted suggestion are left empty and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pending = Suggestion.objects.filter(locations_fingerprint__isnull=True).prefetch_related("locations")
+        filled = duplicates = 0
+        last_id = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id).order_by("id")[:options["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            taken = set(
+                Suggestion.objects.filter(
+                    user_id__in={suggestion.user_id for suggestion in batch},
+                    prompt_id__in={suggestion.prompt_id for suggestion in batch},
+                    locations_fingerprint__isnull=False,
+                ).values_list("user_id", "prompt_id", "locations_fingerprint")
+            )
+            updated = []
+            for suggestion in batch:
+                fingerprint = Suggestion.make_fingerprint(location.pk for location in suggestion.locations.all())
+                key = (suggestion.user_id, suggestion.prompt_id, fingerprint)
+                if key in taken:
+                    duplicates += 1
+                    continue
+                taken.add(key)
+                suggestion.locations_fingerprint = fingerprint
+                updated.append(suggestion)
+
+            Suggestion.objects.bulk_update(updated, ["locations_fingerprint"])
+            filled += len(updated)
+
+        self.stdout.write(f"Fingerprinted {filled} suggestions; {duplicates} duplicates left without one.")
@@ -1,8 +1,16 @@
+import hashlib
 from django.db import models
 from django.conf import settings  # Recommended for referencing AUTH_USER_MODEL
 from django.core.exceptions import ValidationError
 
+def location_hash(name, address) -> str:
+    """Stable hash of a place's name and address, ignoring case and whitespace."""
+    normalized = "|".join(" ".join(str(value or "").lower().split()) for value in (name, address))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
 class Location(models.Model):
+    # Places ID, or "local:<location_hash>" for places saved without one
+    place_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     address = models.TextField()
     lat = models.FloatField()
@@ -15,16 +23,30 @@ class Location(models.Model):
     recommendation_reason = models.TextField(null=True, blank=True)
     photo_url = models.URLField(max_length=500, null=True, blank=True)
 
+    @staticmethod
+    def place_key(place_id, name, address) -> str:
+        """Identity a location is stored under."""
+        return place_id or f"local:{location_hash(name, address)}"
+
     def __str__(self):
         return self.name
 
 class Prompt(models.Model):
+    # Stored in the canonical form built by suggestions.prompts.normalize_prompt
     price = models.IntegerField(default=0)
     food_preference = models.CharField(max_length=255, default='any')
     dietary_preference = models.CharField(max_length=255, default='any')
     lat = models.FloatField()
     lng = models.FloatField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['lat', 'lng', 'price', 'food_preference', 'dietary_preference'],
+                name='unique_prompt',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.food_preference} - {self.dietary_preference}"
 
@@ -37,13 +59,42 @@ class Suggestion(models.Model):
     )
     prompt = models.ForeignKey(Prompt, on_delete=models.CASCADE, related_name='suggestions')
     locations = models.ManyToManyField(Location, related_name='suggestions')
+    # Hash of the sorted location ids, so duplicates are found with one indexed lookup
+    locations_fingerprint = models.CharField(max_length=64, null=True, blank=True)
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.locations.count() > 10:
-            raise ValidationError("A suggestion cannot have more than 10 locations.")
+    MAX_LOCATIONS = 10
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'prompt', 'locations_fingerprint'],
+                name='unique_suggestion_locations',
+            ),
+        ]
+        indexes = [
+            # Serves history pages and exports, newest first
+            models.Index(fields=['user', '-date_created', '-id'], name='suggestion_user_created_idx'),
+            # Serves sync/
+            models.Index(fields=['user', 'date_updated', 'id'], name='suggestion_user_updated_idx'),
+        ]
+
+    @staticmethod
+    def make_fingerprint(location_ids) -> str:
+        joined = ",".join(str(location_id) for location_id in sorted(location_ids))
+        return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+    def set_locations(self, locations):
+        """Replace the locations, enforcing the cap and keeping the fingerprint in sync."""
+        if len(locations) > self.MAX_LOCATIONS:
+            raise ValidationError(f"A suggestion cannot have more than {self.MAX_LOCATIONS} locations.")
+
+        fingerprint = self.make_fingerprint(location.pk for location in locations)
+        if fingerprint != self.locations_fingerprint:
+            self.locations_fingerprint = fingerprint
+            self.save(update_fields=['locations_fingerprint', 'date_updated'])
+        self.locations.set(locations)
 
     def __str__(self):
         return f"Suggestion for {self.prompt} ({self.locations.count()} locations)"
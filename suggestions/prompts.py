@@ -0,0 +1,49 @@
+from django.conf import settings
+from weats_backend.instrumentation import timed
+from .models import Prompt
+
+DEFAULT_PREFERENCE = "any"
+
+
+def normalize_preference(value) -> str:
+    """Lowercase a free-text preference and collapse its whitespace."""
+    normalized = " ".join(str(value or "").lower().split())
+    return normalized[:255] or DEFAULT_PREFERENCE
+
+
+def normalize_price(value) -> int:
+    try:
+        return max(int(round(float(value))), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def quantize(lat: float, lng: float) -> tuple:
+    """Snap a coordinate pair to the prompt geocell grid."""
+    precision = settings.PROMPT_GEOCELL_PRECISION
+    return round(float(lat), precision), round(float(lng), precision)
+
+
+def normalize_prompt(data: dict) -> dict:
+    """
+    Canonical Prompt fields for a search. Accepts the budget as either
+    "price" (search requests) or "max_price" (older clients).
+    """
+    lat, lng = quantize(data.get("lat", 0.0), data.get("lng", 0.0))
+    price = data.get("price")
+    if price is None:
+        price = data.get("max_price", 0)
+    return {
+        "lat": lat,
+        "lng": lng,
+        "price": normalize_price(price),
+        "food_preference": normalize_preference(data.get("food_preference")),
+        "dietary_preference": normalize_preference(data.get("dietary_preference")),
+    }
+
+
+@timed("db")
+def get_or_create_prompt(data: dict) -> Prompt:
+    """Return the shared Prompt row for a search, creating it on first use."""
+    prompt, created = Prompt.objects.get_or_create(**normalize_prompt(data))
+    return prompt
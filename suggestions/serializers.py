@@ -1,3 +1,4 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from .models import Prompt, Location, Suggestion
 
@@ -5,6 +6,7 @@ class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
         fields = '__all__'
+        read_only_fields = ['place_id']
 
 
 class PromptSerializer(serializers.ModelSerializer):
@@ -35,14 +37,52 @@ class SuggestionSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         locations = validated_data.pop('locations', [])
-        user = self.context['request'].user
+        validated_data.setdefault('user', self.context['request'].user)
 
-        suggestion = Suggestion.objects.create(user=user, **validated_data)
-        suggestion.locations.set(locations)
+        try:
+            with transaction.atomic():
+                suggestion = Suggestion.objects.create(**validated_data)
+                suggestion.set_locations(locations)
+        except IntegrityError:
+            raise serializers.ValidationError("Suggestion already exists.")
         return suggestion
 
     def update(self, instance, validated_data):
-        if 'locations' in validated_data:
-            locations = validated_data.pop('locations')
-            instance.locations.set(locations)
-        return super().update(instance, validated_data)
+        try:
+            with transaction.atomic():
+                if 'locations' in validated_data:
+                    locations = validated_data.pop('locations')
+                    instance.set_locations(locations)
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError("Suggestion already exists.")
+
+
+_datetime_field = serializers.DateTimeField()
+
+LOCATION_FIELDS = (
+    'id', 'place_id', 'name', 'address', 'lat', 'lng', 'rating', 'user_ratings_total',
+    'price_level', 'types', 'description', 'recommendation_reason', 'photo_url',
+)
+PROMPT_FIELDS = ('id', 'price', 'food_preference', 'dietary_preference', 'lat', 'lng')
+
+
+class SuggestionListSerializer(serializers.BaseSerializer):
+    """
+    Read-only SuggestionSerializer output built straight from model attributes,
+    for list views. Expects the queryset to select_related("prompt") and
+    prefetch_related("locations") so a page renders in a fixed number of queries.
+    """
+
+    def to_representation(self, suggestion):
+        prompt = suggestion.prompt
+        return {
+            'id': suggestion.id,
+            'prompt': {field: getattr(prompt, field) for field in PROMPT_FIELDS},
+            'locations': [
+                {field: getattr(location, field) for field in LOCATION_FIELDS}
+                for location in suggestion.locations.all()
+            ],
+            'date_created': _datetime_field.to_representation(suggestion.date_created),
+            'date_updated': _datetime_field.to_representation(suggestion.date_updated),
+        }
@@ -1,3 +1,223 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from weats_backend.testing import QueryBudgetMixin
+from .models import Location, Suggestion
+from .prompts import get_or_create_prompt, normalize_prompt
 
-# Create your tests here.
+User = get_user_model()
+
+
+def restaurant(i: int) -> dict:
+    return {
+        "place_id": f"place-{i}",
+        "name": f"Restaurant {i}",
+        "address": f"{i} Test Street",
+        "lat": 14.55,
+        "lng": 121.02,
+        "rating": 4.5,
+        "user_ratings_total": 100,
+        "price_level": 2,
+        "types": ["restaurant"],
+        "description": "A restaurant.",
+        "recommendation_reason": "Close by.",
+    }
+
+
+class SuggestionTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="eater@example.com", username="eater", password="password123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.prompt = get_or_create_prompt({"lat": 14.55, "lng": 121.02, "food_preference": "ramen"})
+        self.locations = Location.objects.bulk_create([
+            Location(place_id=f"place-{i}", name=f"Restaurant {i}", address=f"{i} Test Street", lat=14.55, lng=121.02)
+            for i in range(110)
+        ])
+
+    def seed_suggestions(self, size: int):
+        """Bring the user's history to `size` suggestions of five locations each."""
+        for i in range(Suggestion.objects.filter(user=self.user).count(), size):
+            suggestion = Suggestion.objects.create(user=self.user, prompt=self.prompt)
+            suggestion.set_locations(self.locations[i:i + 5])
+
+
+class PromptNormalizationTests(TestCase):
+    def test_nearby_searches_share_a_prompt(self):
+        first = get_or_create_prompt({"lat": 14.55471, "lng": 121.02441, "food_preference": "  Ramen ", "price": "300"})
+        second = get_or_create_prompt({"lat": 14.55469, "lng": 121.02438, "food_preference": "ramen", "max_price": 300})
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(first.price, 300)
+        self.assertEqual(first.dietary_preference, "any")
+
+    @override_settings(PROMPT_GEOCELL_PRECISION=2)
+    def test_precision_is_configurable(self):
+        self.assertEqual(normalize_prompt({"lat": 14.556, "lng": 121.024})["lat"], 14.56)
+
+
+class SaveSuggestionsTests(SuggestionTestCase):
+    url = "/api/suggestions/save_suggestions/"
+
+    def save(self, restaurants):
+        return self.client.post(self.url, {
+            "lat": 14.55, "lng": 121.02,
+            "preferences": {"food_preference": "ramen"},
+            "restaurants": restaurants,
+        }, format="json")
+
+    def test_saves_and_rejects_duplicates(self):
+        restaurants = [restaurant(i) for i in range(10)]
+        response = self.save(restaurants)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Suggestion.objects.get(pk=response.data["suggestion_id"]).locations.count(), 10)
+
+        response = self.save(list(reversed(restaurants)))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["code"], "DUPLICATE_SUGGESTION")
+
+    def test_backfills_fingerprints_once_per_location_set(self):
+        legacy = [Suggestion.objects.create(user=self.user, prompt=self.prompt) for _ in range(3)]
+        for suggestion in legacy:
+            suggestion.locations.set(self.locations[:3])
+        legacy[2].locations.set(self.locations[3:6])
+
+        out = io.StringIO()
+        call_command("backfill_suggestion_fingerprints", stdout=out)
+        self.assertIn("Fingerprinted 2 suggestions; 1 duplicates", out.getvalue())
+        legacy[0].refresh_from_db()
+        self.assertEqual(legacy[0].locations_fingerprint, Suggestion.make_fingerprint(loc.pk for loc in self.locations[:3]))
+
+        # The backfilled row now blocks a resave of the same places
+        response = self.save([restaurant(i) for i in range(3)])
+        self.assertEqual(response.status_code, 409)
+
+    def test_backfills_local_place_ids(self):
+        legacy = Location.objects.bulk_create([
+            Location(name="Corner Cafe", address="1 Side Street", lat=14.55, lng=121.02),
+            Location(name="corner cafe ", address="1 side street", lat=14.55, lng=121.02),
+            Location(name="Night Market", address="2 Side Street", lat=14.55, lng=121.02),
+        ])
+
+        out = io.StringIO()
+        call_command("backfill_location_place_ids", stdout=out)
+        self.assertIn("Keyed 2 locations; 1 duplicates", out.getvalue())
+        legacy[0].refresh_from_db()
+        self.assertEqual(legacy[0].place_id, Location.place_key(None, "Corner Cafe", "1 Side Street"))
+
+        # Saving the same place without a Places ID now reuses the backfilled row
+        response = self.save([dict(restaurant(0), place_id=None, name="Corner Cafe", address="1 Side Street")])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Location.objects.filter(place_id=legacy[0].place_id).count(), 1)
+
+    def test_reuses_locations_by_place_id(self):
+        self.save([restaurant(i) for i in range(5)])
+        moved = dict(restaurant(0), address="0 Test Street, 2nd floor")
+        self.save([moved] + [restaurant(i) for i in range(5, 9)])
+        self.assertEqual(Location.objects.filter(place_id="place-0").count(), 1)
+
+    def test_query_count_does_not_grow_with_history(self):
+        sent = iter(range(10 ** 6))
+
+        def save():
+            # A new location set each time, so every request inserts a suggestion
+            self.assertEqual(self.save([restaurant(next(sent)) for _ in range(10)]).status_code, 200)
+
+        self.assertConstantQueries(self.seed_suggestions, save, limit=20)
+
+
+class SuggestionHistoryTests(SuggestionTestCase):
+    def test_user_suggestions_query_count_is_constant(self):
+        request = lambda: self.client.get("/api/suggestions/user_suggestions/")
+        self.assertConstantQueries(self.seed_suggestions, request, limit=4)
+
+        response = request()
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertEqual(response.data["count"], 100)
+        self.assertEqual(len(response.data["results"][0]["locations"]), 5)
+
+    def test_pages_are_read_from_an_index(self):
+        pages = Suggestion.objects.filter(user=self.user).order_by('-date_created', '-id')
+        self.assertIndexedOrdering(pages[:21])
+
+    def test_suggestion_list_query_count_is_constant(self):
+        self.assertConstantQueries(self.seed_suggestions, lambda: self.client.get("/api/suggestions/suggestions/"), limit=4)
+
+    def test_pages_cover_the_history_once(self):
+        self.seed_suggestions(45)
+        seen, url = [], "/api/suggestions/user_suggestions/?page_size=10"
+        while url:
+            response = self.client.get(url)
+            seen += [suggestion["id"] for suggestion in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(sorted(seen), sorted(Suggestion.objects.values_list("id", flat=True)))
+
+    def test_history_is_private(self):
+        self.seed_suggestions(3)
+        other = User.objects.create_user(email="other@example.com", username="other", password="password123")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get("/api/suggestions/user_suggestions/").data["results"], [])
+
+
+class SuggestionExportTests(SuggestionTestCase):
+    url = "/api/suggestions/user_suggestions/export/"
+
+    def export(self, output):
+        response = self.client.get(self.url, {"output": output})
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        self.seed_suggestions(3)
+        lines = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(len(lines[0]["locations"]), 5)
+        self.assertEqual(lines[0]["prompt"]["food_preference"], "ramen")
+
+    def test_csv_has_a_row_per_location(self):
+        self.seed_suggestions(2)
+        rows = list(csv.DictReader(io.StringIO(self.export("csv"))))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]["prompt_food_preference"], "ramen")
+        self.assertTrue(rows[0]["name"].startswith("Restaurant "))
+
+    def test_query_count_is_constant(self):
+        self.assertConstantQueries(self.seed_suggestions, lambda: self.export("ndjson"), limit=3)
+
+    def test_rejects_unknown_formats(self):
+        self.assertEqual(self.client.get(self.url, {"output": "xml"}).status_code, 400)
+
+
+class SuggestionViewSetTests(SuggestionTestCase):
+    def test_create_retrieve_and_duplicate(self):
+        body = {"prompt_id": self.prompt.id, "location_ids": [location.id for location in self.locations[:3]]}
+        response = self.client.post("/api/suggestions/suggestions/", body, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        detail = self.assertMaxQueries(4, lambda: self.client.get(f"/api/suggestions/suggestions/{response.data['id']}/"))
+        self.assertEqual(len(detail.data["locations"]), 3)
+
+        body["location_ids"].reverse()
+        self.assertEqual(self.client.post("/api/suggestions/suggestions/", body, format="json").status_code, 400)
+
+    def test_location_cap(self):
+        suggestion = Suggestion.objects.create(user=self.user, prompt=self.prompt)
+        with self.assertRaises(ValidationError):
+            suggestion.set_locations(self.locations[:11])
+
+    def test_prompt_and_location_lists_are_paginated(self):
+        for url in ("/api/suggestions/prompts/", "/api/suggestions/locations/"):
+            response = self.assertMaxQueries(2, lambda: self.client.get(url, {"page_size": 5}))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 5)
+
+    def test_prompts_and_locations_are_read_only(self):
+        location = self.locations[0]
+        for url in ("/api/suggestions/prompts/", "/api/suggestions/locations/"):
+            self.assertEqual(APIClient().get(url).status_code, 401)
+            self.assertEqual(self.client.post(url, {"place_id": "planted", "name": "Planted"}).status_code, 405)
+        self.assertEqual(self.client.delete(f"/api/suggestions/locations/{location.pk}/").status_code, 405)
+        self.assertTrue(Location.objects.filter(pk=location.pk).exists())
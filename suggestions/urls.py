@@ -1,11 +1,15 @@
 from django.urls import path, include
-from .views import PromptViewSet, LocationViewSet, SuggestionViewSet, save_suggestions, user_suggestions
+from rest_framework.routers import DefaultRouter
+from .views import PromptViewSet, LocationViewSet, SuggestionViewSet, save_suggestions, user_suggestions, export_suggestions
 
+router = DefaultRouter()
+router.register(r'prompts', PromptViewSet, basename='prompt')
+router.register(r'locations', LocationViewSet, basename='location')
+router.register(r'suggestions', SuggestionViewSet, basename='suggestion')
 
 urlpatterns = [
-    path('prompts/', PromptViewSet.as_view, name="prompt-view"),
-    path('locations/',LocationViewSet.as_view, name="location-view"),
-    path('suggestions/',SuggestionViewSet.as_view, name="suggestion-view"),
     path('save_suggestions/', save_suggestions, name="save_suggestions"),
-    path('user_suggestions/', user_suggestions, name="user_suggestions")
+    path('user_suggestions/', user_suggestions, name="user_suggestions"),
+    path('user_suggestions/export/', export_suggestions, name="export_suggestions"),
+    path('', include(router.urls)),
 ]
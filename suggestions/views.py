@@ -1,46 +1,57 @@
+import logging
 import os
+from django.db import IntegrityError, transaction
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status
 from .models import Prompt, Location, Suggestion
-from .serializers import PromptSerializer, LocationSerializer, SuggestionSerializer
+from .serializers import (
+    PromptSerializer, LocationSerializer, SuggestionSerializer, SuggestionListSerializer, PROMPT_FIELDS,
+)
+from .prompts import get_or_create_prompt
+from weats_backend.instrumentation import stage
+from weats_backend.export import EXPORT_FORMATS, EXPORT_CHUNK_SIZE, export_response
+from weats_backend.pagination import HistoryCursorPagination, IdCursorPagination
 
 GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
 MAX_FINAL_RESULTS = 10   # Final number of recommendations
 
-def get_or_create_prompt(data):
-    # Set default values for required fields
-    max_price = data.get('max_price', 0)  # Default to 0 if not provided
-    food_preference = data.get('food_preference', 'any')
-    dietary_preference = data.get('dietary_preference', 'any')
-    lat = data.get('lat', 0.0)
-    lng = data.get('lng', 0.0)
-
-    prompt, created = Prompt.objects.get_or_create(
-        price=max_price,
-        food_preference=food_preference,
-        dietary_preference=dietary_preference,
-        lat=lat,
-        lng=lng
-    )
-    return prompt
+# CSV exports have one row per suggested location
+SUGGESTION_CSV_FIELDS = (
+    ('suggestion_id', 'date_created')
+    + tuple(f'prompt_{field}' for field in PROMPT_FIELDS if field != 'id')
+    + ('place_id', 'name', 'address', 'lat', 'lng', 'rating', 'price_level', 'types')
+)
+
+logger = logging.getLogger(__name__)
 
-class PromptViewSet(viewsets.ModelViewSet):
+# Prompts and locations are shared by every user and only written by save_suggestions
+class PromptViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Prompt.objects.all()
     serializer_class = PromptSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
 
-class LocationViewSet(viewsets.ModelViewSet):
+class LocationViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
 
 class SuggestionViewSet(viewsets.ModelViewSet):
     serializer_class = SuggestionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = HistoryCursorPagination
 
     def get_queryset(self):
-        return Suggestion.objects.filter(user=self.request.user)
+        return Suggestion.objects.filter(user=self.request.user).select_related("prompt").prefetch_related("locations")
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SuggestionListSerializer
+        return SuggestionSerializer
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -66,47 +77,52 @@ def save_suggestions(request):
         prompt = get_or_create_prompt({
             "lat": lat,
             "lng": lng,
-            "food_preference": preferences.get("food_preference", "any"),
-            "dietary_preference": preferences.get("dietary_preference", "any"),
-            "max_price": preferences.get("max_price", 0)
+            "food_preference": preferences.get("food_preference"),
+            "dietary_preference": preferences.get("dietary_preference"),
+            "price": preferences.get("price"),
+            "max_price": preferences.get("max_price"),
         })
 
-        location_objs = []
+        # Insert the locations we have not seen before in one query, keeping existing rows as they are
+        new_locations = {}
         for loc in locations[:MAX_FINAL_RESULTS]:
-            location, _ = Location.objects.get_or_create(
+            place_key = Location.place_key(loc.get("place_id"), loc.get("name"), loc.get("address"))
+            new_locations[place_key] = Location(
+                place_id=place_key,
                 name=loc.get("name"),
                 address=loc.get("address"),
                 lat=loc.get("lat"),
                 lng=loc.get("lng"),
-                defaults={
-                    "rating": loc.get("rating", 0),
-                    "user_ratings_total": loc.get("user_ratings_total", 0),
-                    "price_level": loc.get("price_level", 1),
-                    "types": loc.get("types", []),
-                    "description": loc.get("description", ""),
-                    "recommendation_reason": loc.get("recommendation_reason", ""),
-                    "photo_url": loc.get("photo_url", None)
-                }
+                rating=loc.get("rating", 0),
+                user_ratings_total=loc.get("user_ratings_total", 0),
+                price_level=loc.get("price_level", 1),
+                types=loc.get("types", []),
+                description=loc.get("description", ""),
+                recommendation_reason=loc.get("recommendation_reason", ""),
+                photo_url=loc.get("photo_url", None)
             )
-            location_objs.append(location)
-
-        existing_suggestions = Suggestion.objects.filter(user=request.user, prompt=prompt)
-
-        for existing in existing_suggestions:
-            existing_location_ids = set(existing.locations.values_list("id", flat=True))
-            new_location_ids = set([loc.id for loc in location_objs])
-            if existing_location_ids == new_location_ids:
-                return Response({
-                    "error": "Suggestion already exists",
-                    "code": "DUPLICATE_SUGGESTION"
-                }, status=409)
+        with stage("db"):
+            Location.objects.bulk_create(new_locations.values(), ignore_conflicts=True)
+            saved_locations = Location.objects.in_bulk(list(new_locations), field_name="place_id")
+        location_objs = [saved_locations[place_key] for place_key in new_locations]
 
-        if len(location_objs) > 10:
+        if len(location_objs) > Suggestion.MAX_LOCATIONS:
             return Response({"error": "Cannot save more than 10 locations."}, status=400)
 
-        suggestion = Suggestion.objects.create(prompt=prompt, user=request.user)
-        suggestion.locations.set(location_objs)
-        suggestion.save()
+        # The (user, prompt, fingerprint) unique constraint rejects duplicates on insert
+        try:
+            with stage("db"), transaction.atomic():
+                suggestion = Suggestion.objects.create(
+                    prompt=prompt,
+                    user=request.user,
+                    locations_fingerprint=Suggestion.make_fingerprint(loc.id for loc in location_objs)
+                )
+                suggestion.set_locations(location_objs)
+        except IntegrityError:
+            return Response({
+                "error": "Suggestion already exists",
+                "code": "DUPLICATE_SUGGESTION"
+            }, status=409)
 
         return Response({
             "prompt_id": prompt.id,
@@ -116,7 +132,7 @@ def save_suggestions(request):
         })
 
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception("Failed to save suggestions")
         return Response({
             "error": "Failed to fetch restaurants",
             "details": str(e)
@@ -125,6 +141,38 @@ def save_suggestions(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_suggestions(request):
-    suggestions = Suggestion.objects.filter(user=request.user).order_by('-date_created').select_related("prompt")
-    serializer = SuggestionSerializer(suggestions, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    suggestions = Suggestion.objects.filter(user=request.user).select_related("prompt").prefetch_related("locations")
+    paginator = HistoryCursorPagination()
+    page = paginator.paginate_queryset(suggestions, request)
+    with stage("serialize"):
+        data = SuggestionListSerializer(page, many=True).data
+    return paginator.get_paginated_response(data)
+
+
+def suggestion_csv_rows(suggestions):
+    """Flatten SuggestionListSerializer output into one row per location."""
+    for suggestion in suggestions:
+        row = {'suggestion_id': suggestion['id'], 'date_created': suggestion['date_created']}
+        row.update({f'prompt_{field}': value for field, value in suggestion['prompt'].items()})
+        for location in suggestion['locations']:
+            yield dict(row, **location)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_suggestions(request):
+    """Stream the user's whole suggestion history as NDJSON or CSV (`?output=ndjson|csv`)."""
+    output = request.query_params.get('output', 'ndjson')
+    if output not in EXPORT_FORMATS:
+        return Response({
+            "error": f"output must be one of {', '.join(EXPORT_FORMATS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    suggestions = (
+        Suggestion.objects.filter(user=request.user).select_related("prompt").prefetch_related("locations")
+        .order_by('-date_created', '-id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    serializer = SuggestionListSerializer()
+    rows = (serializer.to_representation(suggestion) for suggestion in suggestions)
+    if output == 'csv':
+        rows = suggestion_csv_rows(rows)
+    return export_response(request, rows, output, SUGGESTION_CSV_FIELDS, 'suggestions')
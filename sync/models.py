@@ -0,0 +1,24 @@
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+
+
+class Tombstone(models.Model):
+    """A deleted visit or suggestion, kept so sync/ can tell clients to drop their copy."""
+    VISIT = 'visit'
+    SUGGESTION = 'suggestion'
+    KIND_CHOICES = [(VISIT, 'Visit'), (SUGGESTION, 'Suggestion')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tombstones')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    date_deleted = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date_deleted', 'id'], name='tombstone_user_date_idx'),
+            models.Index(fields=['date_deleted'], name='tombstone_date_idx'),  # Pruning
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted on {self.date_deleted}"
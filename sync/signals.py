@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from suggestions.models import Suggestion
+from visited.models import VisitedLocation
+from .models import Tombstone
+
+
+def deleting_user(origin) -> bool:
+    """Whether a delete cascades from deleting users, whose tombstones would go with them."""
+    model = getattr(origin, 'model', type(origin))
+    return issubclass(model, get_user_model())
+
+
+@receiver(post_delete, sender=VisitedLocation)
+def bury_visit(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin):
+        Tombstone.objects.create(user_id=instance.user_id, kind=Tombstone.VISIT, object_id=instance.pk)
+
+
+@receiver(post_delete, sender=Suggestion)
+def bury_suggestion(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin):
+        Tombstone.objects.create(user_id=instance.user_id, kind=Tombstone.SUGGESTION, object_id=instance.pk)
@@ -0,0 +1,103 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from suggestions.models import Location, Suggestion
+from suggestions.prompts import get_or_create_prompt
+from visited.models import VisitedLocation
+from weats_backend.testing import QueryBudgetMixin
+from .models import Tombstone
+from .views import encode_cursor
+
+User = get_user_model()
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(QueryBudgetMixin, TestCase):
+    url = "/api/sync/"
+
+    def setUp(self):
+        caches["shared"].clear()
+        self.user = User.objects.create_user(email="eater@example.com", username="eater", password="password123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.prompt = get_or_create_prompt({"lat": 14.55, "lng": 121.02, "food_preference": "ramen"})
+        self.location = Location.objects.create(
+            place_id="place-0", name="Restaurant 0", address="0 Test Street", lat=14.55, lng=121.02
+        )
+
+    def visit(self, i: int) -> VisitedLocation:
+        return VisitedLocation.objects.create(
+            user=self.user, name=f"Restaurant {i}", address=f"{i} Test Street", lat=14.55, lng=121.02
+        )
+
+    def seed_history(self, size: int):
+        """Bring the user's visits and suggestions to `size` each."""
+        for i in range(VisitedLocation.objects.filter(user=self.user).count(), size):
+            self.visit(i)
+            prompt = get_or_create_prompt({"lat": 14.55, "lng": 121.02, "food_preference": f"food {i}"})
+            Suggestion.objects.create(user=self.user, prompt=prompt).set_locations([self.location])
+
+    def sync(self, cursor=None, **params):
+        if cursor:
+            params["cursor"] = cursor
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_then_delta_sync(self):
+        self.seed_history(3)
+        full = self.sync()
+        self.assertEqual((len(full["visits"]), len(full["suggestions"]), full["has_more"]), (3, 3, False))
+        self.assertEqual(self.sync(full["cursor"])["visits"], [])
+
+        changed = VisitedLocation.objects.filter(user=self.user).first()
+        self.client.patch(f"/api/visited/{changed.id}/", {"notes": "Great ramen"}, format="json")
+        removed = self.client.post("/api/visited/toggle_visited/", {"location": {
+            "name": "Restaurant 1", "address": "1 Test Street"
+        }}, format="json")
+        self.assertFalse(removed.data["is_visited"])
+        suggestion = Suggestion.objects.filter(user=self.user).last()
+        self.client.delete(f"/api/suggestions/suggestions/{suggestion.id}/")
+
+        delta = self.sync(full["cursor"])
+        self.assertEqual([visit["notes"] for visit in delta["visits"]], ["Great ramen"])
+        self.assertEqual(delta["suggestions"], [])
+        self.assertEqual(len(delta["deleted"]["visits"]), 1)
+        self.assertEqual(delta["deleted"]["suggestions"], [suggestion.id])
+
+    def test_pages_cover_everything_once(self):
+        self.seed_history(5)
+        visits, cursor, more = [], None, True
+        while more:
+            page = self.sync(cursor, limit=2)
+            visits += [visit["id"] for visit in page["visits"]]
+            cursor, more = page["cursor"], page["has_more"]
+        self.assertEqual(sorted(visits), sorted(VisitedLocation.objects.values_list("id", flat=True)))
+
+    def test_delta_query_count_does_not_grow_with_history(self):
+        cursor = {}
+
+        def seed(size):
+            self.seed_history(size)
+            cursor["value"] = self.sync()["cursor"]
+
+        self.assertConstantQueries(seed, lambda: self.sync(cursor["value"]), limit=3)
+
+    def test_recent_changes_wait_to_settle(self):
+        self.visit(1)
+        with self.settings(SYNC_SETTLE_SECONDS=60):
+            self.assertEqual(self.sync()["visits"], [])
+
+    def test_rejects_bad_and_expired_cursors(self):
+        self.assertEqual(self.client.get(self.url, {"cursor": "nope"}).status_code, 400)
+        old = timezone.now() - timedelta(days=365)
+        expired = encode_cursor({"visits": (old, 0), "suggestions": (old, 0), "deleted": (old, 0)})
+        self.assertEqual(self.client.get(self.url, {"cursor": expired}).status_code, 410)
+
+    def test_deleting_a_user_leaves_no_tombstones(self):
+        self.seed_history(2)
+        self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
@@ -0,0 +1,130 @@
+"""
+Delta sync of a user's visits and suggestions.
+
+The cursor holds, for each stream, the (timestamp, id) of the last row the
+client has. Rows changed in the last SYNC_SETTLE_SECONDS are held back until
+the next sync, so a row written by a transaction that commits a little late
+is not skipped. Clients apply the upserts first, then the deletions.
+
+Rows are found by date_updated, an auto_now field: save() bumps it, while
+bulk_update() and queryset update() leave it alone. Backfills of columns
+clients never see use the latter, so clients do not re-download those rows.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from suggestions.models import Suggestion
+from suggestions.serializers import SuggestionListSerializer
+from visited.models import VisitedLocation
+from visited.serializers import VisitedLocationSerializer
+from .models import Tombstone
+
+STREAMS = ('visits', 'suggestions', 'deleted')
+
+
+def encode_cursor(positions: dict) -> str:
+    data = {stream: [position[0].isoformat(), position[1]] for stream, position in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token: str) -> dict:
+    """Raises ValueError for anything encode_cursor did not produce."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        positions = {stream: (datetime.fromisoformat(data[stream][0]), int(data[stream][1])) for stream in STREAMS}
+    except (KeyError, TypeError, IndexError, UnicodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if any(timezone.is_naive(timestamp) for timestamp, _ in positions.values()):
+        raise ValueError("Invalid cursor")
+    return positions
+
+
+def changes(queryset, field: str, position, until, limit: int) -> tuple:
+    """
+    Up to `limit` rows changed after `position` and no later than `until`,
+    oldest first. Returns the rows, the position to resume from and whether
+    more rows are waiting.
+    """
+    rows = queryset.filter(**{f'{field}__lte': until})
+    if position is not None:
+        timestamp, pk = position
+        rows = rows.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk}))
+    rows = list(rows.order_by(field, 'id')[:limit + 1])
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if more:
+        position = (getattr(rows[-1], field), rows[-1].pk)
+    elif rows and getattr(rows[-1], field) == until:
+        position = (until, rows[-1].pk)
+    else:
+        position = (until, 0)  # Caught up
+    return rows, position, more
+
+
+def sync_page_size(request) -> int:
+    try:
+        limit = int(request.query_params.get('limit', settings.SYNC_PAGE_SIZE))
+    except ValueError:
+        limit = settings.SYNC_PAGE_SIZE
+    return min(max(limit, 1), settings.SYNC_MAX_PAGE_SIZE)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    Visits and suggestions changed since `cursor`, and the ids of those deleted.
+    Without a cursor everything is sent. Call again with the returned cursor
+    while `has_more` is true, and on the next app open.
+    """
+    now = timezone.now()
+    until = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    token = request.query_params.get('cursor')
+    if token:
+        try:
+            positions = decode_cursor(token)
+        except ValueError:
+            return Response({
+                "error": "Invalid cursor",
+                "code": "INVALID_CURSOR"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if positions['deleted'][0] < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+            return Response({
+                "error": "Cursor is too old to sync deletions; sync again without a cursor",
+                "code": "CURSOR_EXPIRED"
+            }, status=status.HTTP_410_GONE)
+    else:
+        # Deletions before a full sync are already reflected in it
+        positions = {'visits': None, 'suggestions': None, 'deleted': (until, 0)}
+
+    limit = sync_page_size(request)
+    visits, positions['visits'], more_visits = changes(
+        VisitedLocation.objects.filter(user=request.user), 'date_updated', positions['visits'], until, limit
+    )
+    suggestions, positions['suggestions'], more_suggestions = changes(
+        Suggestion.objects.filter(user=request.user).select_related("prompt").prefetch_related("locations"),
+        'date_updated', positions['suggestions'], until, limit
+    )
+    tombstones, positions['deleted'], more_deleted = changes(
+        Tombstone.objects.filter(user=request.user), 'date_deleted', positions['deleted'], until, limit
+    )
+
+    deleted = {'visits': [], 'suggestions': []}
+    for tombstone in tombstones:
+        deleted['visits' if tombstone.kind == Tombstone.VISIT else 'suggestions'].append(tombstone.object_id)
+
+    return Response({
+        'visits': VisitedLocationSerializer(visits, many=True).data,
+        'suggestions': SuggestionListSerializer(suggestions, many=True).data,
+        'deleted': deleted,
+        'cursor': encode_cursor(positions),
+        'has_more': more_visits or more_suggestions or more_deleted
+    })
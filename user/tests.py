@@ -1,3 +1,73 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+from weats_backend.testing import QueryBudgetMixin
 
-# Create your tests here.
+User = get_user_model()
+
+
+class AuthTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="eater@example.com", username="eater", password="password123")
+
+    def login(self):
+        return self.client.post("/api/users/login", {"email": "eater@example.com", "password": "password123"}, format="json")
+
+    def test_register(self):
+        body = {
+            "username": "new", "email": "new@example.com",
+            "password": "password123", "password_confirmation": "password123",
+        }
+        response = self.assertMaxQueries(3, lambda: self.client.post("/api/users/register", body, format="json"))
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.filter(email="new@example.com").exists())
+
+    def test_login_user_refresh_and_logout(self):
+        tokens = self.assertMaxQueries(3, self.login).data
+        self.assertIn("access", tokens)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        response = self.assertMaxQueries(1, lambda: self.client.get("/api/users/user"))
+        self.assertEqual(response.data["email"], "eater@example.com")
+
+        response = self.assertMaxQueries(2, lambda: self.client.post("/api/users/refresh", {"refresh": tokens["refresh"]}, format="json"))
+        self.assertIn("access", response.data)
+
+        response = self.client.post("/api/users/logout", {"refresh": tokens["refresh"]}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_rejects_a_wrong_password(self):
+        response = self.client.post("/api/users/login", {"email": "eater@example.com", "password": "wrongpassword"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_password_reset(self):
+        response = self.assertMaxQueries(1, lambda: self.client.post("/api/users/forgot-password", {"email": "eater@example.com"}, format="json"))
+        self.assertEqual(response.status_code, 200)
+        code = cache.get("password_reset_eater@example.com")
+        self.assertIn(code, mail.outbox[0].body)
+
+        body = {"email": "eater@example.com", "code": code}
+        self.assertEqual(self.client.post("/api/users/verify-code", body, format="json").status_code, 200)
+
+        body["new_password"] = "newpassword123"
+        response = self.assertMaxQueries(2, lambda: self.client.post("/api/users/reset-password", body, format="json"))
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("newpassword123"))
+
+    def test_google_login(self):
+        id_info = {"email": "google@example.com", "given_name": "Goo", "family_name": "Gle"}
+        with mock.patch("user.views.google_id_token.verify_oauth2_token", return_value=id_info):
+            response = self.assertMaxQueries(6, lambda: self.client.post("/api/users/google", {"id_token": "token"}, format="json"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.filter(email="google@example.com").exists())
+
+    def test_google_login_rejects_invalid_tokens(self):
+        with mock.patch("user.views.google_id_token.verify_oauth2_token", side_effect=ValueError):
+            response = self.client.post("/api/users/google", {"id_token": "token"}, format="json")
+        self.assertEqual(response.status_code, 400)
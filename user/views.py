@@ -12,8 +12,9 @@ from rest_framework import status
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
+from weats_backend.upstream import google_auth_request
 from dotenv import load_dotenv
+import logging
 import os
 import random
 import string
@@ -25,6 +26,8 @@ load_dotenv()
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -108,22 +111,18 @@ def google_login_view(request):
         return Response({'error': 'ID token is required'}, status=status.HTTP_400_BAD_REQUEST)
  
     try:
-        print("token", id_token_from_client)
-        print("client",os.getenv('GOOGLE_CLIENT_ID'))
         id_info = google_id_token.verify_oauth2_token(
             id_token_from_client,
-            google_requests.Request(),
+            google_auth_request(),
             os.getenv('GOOGLE_CLIENT_ID') 
         )
-        
-        print('asdsadasd')
+
         email = id_info.get('email')
         first_name = id_info.get('given_name', '')
         last_name = id_info.get('family_name', '')
         username = email.split('@')[0]  # basic username
 
         if not email:
-            print('here')
             return Response({'error': 'Google account did not return an email'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Try to get existing user, or create if not exists
@@ -147,8 +146,7 @@ def google_login_view(request):
         access_token = str(refresh.access_token)
 
         user_serializer = UserSerializer(user)
-        
-        print("access_token", access_token)
+
 
         return Response({
             "access": access_token,
@@ -216,8 +214,8 @@ def forgot_password(request):
             fail_silently=False,
             html_message=html_message
         )
-    except Exception as e:
-        print(f"Email sending error: {str(e)}")  # For debugging
+    except Exception:
+        logger.exception("Failed to send the password reset email")
         return Response(
             {"message": "Failed to send verification code"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import VisitedLocation
+from .models import VisitedLocation, VisitDailyRollup
 # Register your models here.
-admin.site.register(VisitedLocation)
\ No newline at end of file
+admin.site.register(VisitedLocation)
+admin.site.register(VisitDailyRollup)
@@ -0,0 +1,66 @@
+"""
+Per-user set of visited place keys in the shared cache.
+
+Batch checks and search annotation are answered from the set; a miss loads
+it with one query. The set is stored under a per-user version, and every
+write to the user's visits bumps the version once its transaction commits
+(see visited.signals). A read that raced a write can only store its stale set
+under the old version, which nothing reads again.
+"""
+import time
+from django.conf import settings
+from django.core.cache import caches
+from map.cache import Counters
+from weats_backend import instrumentation
+from .models import VisitedLocation
+
+stats = Counters("hits", "misses", "invalidations")
+instrumentation.register_counters("weats_visited_cache", stats)
+
+
+def version_key(user_id) -> str:
+    return f"visited:version:{user_id}"
+
+
+def cache_key(user_id, version) -> str:
+    return f"visited:keys:{user_id}:{version}"
+
+
+def current_version(user_id) -> int:
+    backend = caches["shared"]
+    version = backend.get(version_key(user_id))
+    if version is None:
+        # Starts from the clock, so a version evicted and recreated never reuses an old key
+        backend.add(version_key(user_id), time.time_ns(), None)
+        version = backend.get(version_key(user_id))
+    return version
+
+
+def get_keys(user_id) -> tuple:
+    """(place ids, location hashes) the user has visited."""
+    backend = caches["shared"]
+    key = cache_key(user_id, current_version(user_id))
+    keys = backend.get(key)
+    if keys is not None:
+        stats.incr("hits")
+        return keys
+    stats.incr("misses")
+    keys = VisitedLocation.visited_keys(user_id)
+    backend.set(key, keys, settings.VISITED_CACHE_TTL)
+    return keys
+
+
+def visited_flags(user, locations: list) -> list:
+    """VisitedLocation.visited_flags, served from the cached set."""
+    if not settings.VISITED_CACHE_ENABLED:
+        return VisitedLocation.visited_flags(user, locations)
+    return VisitedLocation.match_flags(locations, *get_keys(user.pk))
+
+
+def invalidate(user_id):
+    """Move the user to a new version; the next read loads the set afresh."""
+    try:
+        caches["shared"].incr(version_key(user_id))
+    except ValueError:
+        pass  # No version, so nothing is cached
+    stats.incr("invalidations")
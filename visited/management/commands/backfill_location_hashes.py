@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from visited import cache
+from visited.models import VisitedLocation
+
+
+class Command(BaseCommand):
+    help = "Fill in location_hash for visits saved before it existed or written around save()."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pending = VisitedLocation.objects.filter(location_hash="").only("id", "user_id", "name", "address")
+        filled = 0
+        users = set()
+        last_id = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id).order_by("id")[:options["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for visit in batch:
+                visit.set_location_hash()
+            VisitedLocation.objects.bulk_update(batch, ["location_hash"])
+            filled += len(batch)
+            users.update(visit.user_id for visit in batch)
+
+        # Cached visited sets were loaded without these hashes
+        for user_id in users:
+            cache.invalidate(user_id)
+        self.stdout.write(f"Hashed {filled} visits of {len(users)} users.")
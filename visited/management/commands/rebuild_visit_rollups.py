@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from visited.models import VisitedLocation, VisitDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user daily visit counts behind recent_visits from the visits themselves."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        days = (
+            VisitedLocation.objects.annotate(day=TruncDate("date_visited"))
+            .values("user_id", "day").annotate(visits=Count("id")).order_by()
+        )
+        with transaction.atomic():
+            VisitDailyRollup.objects.all().delete()
+            created = VisitDailyRollup.objects.bulk_create(
+                (VisitDailyRollup(**row) for row in days.iterator()), batch_size=options["batch_size"]
+            )
+        self.stdout.write(f"Rebuilt {len(created)} daily rollups.")
@@ -1,12 +1,38 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q
+from django.db.models.functions import TruncDate
 from django.conf import settings
+from django.utils import timezone
+from suggestions.models import location_hash
 
 # Create your models here.
 
+class VisitedLocationQuerySet(models.QuerySet):
+    """Keeps location_hash in step on the bulk paths, which skip save()."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for visit in objs:
+            visit.set_location_hash()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        fields = list(fields)
+        if ('name' in fields or 'address' in fields) and 'location_hash' not in fields:
+            objs = list(objs)
+            for visit in objs:
+                visit.set_location_hash()
+            fields.append('location_hash')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class VisitedLocation(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='visited_locations')
+    place_id = models.CharField(max_length=255, null=True, blank=True)
     name = models.CharField(max_length=255)
     address = models.TextField()
+    # suggestions.models.location_hash of name and address, set on save
+    location_hash = models.CharField(max_length=40, editable=False, default='')
     lat = models.FloatField()
     lng = models.FloatField()
     rating = models.FloatField(null=True, blank=True)
@@ -16,12 +42,130 @@ class VisitedLocation(models.Model):
     description = models.TextField(null=True, blank=True)   
     recommendation_reason = models.TextField(null=True, blank=True)
     photo_url = models.URLField(null=True, blank=True)
-    date_visited = models.DateTimeField(auto_now_add=True)
+    date_visited = models.DateTimeField(default=timezone.now)  # Set explicitly by imports
+    date_updated = models.DateTimeField(auto_now=True)
     notes = models.TextField(blank=True, null=True)
 
+    objects = VisitedLocationQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'name', 'address')  # Prevent duplicate visits
         ordering = ['-date_visited']  # Most recent visits first
+        indexes = [
+            # Serves history pages and the recent_visits window
+            models.Index(fields=['user', '-date_visited', '-id'], name='visit_user_date_idx'),
+            # Serve visited_flags
+            models.Index(fields=['user', 'place_id'], name='visit_user_place_idx'),
+            models.Index(fields=['user', 'location_hash'], name='visit_user_hash_idx'),
+            # Serves sync/
+            models.Index(fields=['user', 'date_updated', 'id'], name='visit_user_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.set_location_hash()
+        super().save(*args, **kwargs)
+
+    def set_location_hash(self):
+        """Done by save() and by bulk_create() / bulk_update() on VisitedLocation.objects."""
+        self.location_hash = location_hash(self.name, self.address)
+
+    @staticmethod
+    def lookup_keys(location: dict) -> tuple:
+        """(place_id, location_hash) a client-supplied location is matched by."""
+        if location.get('name') or location.get('address'):
+            key = location_hash(location.get('name'), location.get('address'))
+        else:
+            key = location.get('location_hash')
+        return location.get('place_id') or None, key or None
+
+    @staticmethod
+    def collect_keys(rows) -> tuple:
+        """(place ids, location hashes) sets from (place_id, location_hash) rows, without empty keys."""
+        place_ids, hashes = set(), set()
+        for place_id, key in rows:
+            if place_id:
+                place_ids.add(place_id)
+            if key:
+                hashes.add(key)
+        return place_ids, hashes
+
+    @classmethod
+    def visited_keys(cls, user_id) -> tuple:
+        """
+        All of a user's visited keys, for visited.cache. Hashes are computed
+        from name and address rather than read, so rows whose location_hash
+        was never filled in still match.
+        """
+        rows = cls.objects.filter(user_id=user_id).order_by().values_list('place_id', 'name', 'address')
+        return cls.collect_keys((place_id, location_hash(name, address)) for place_id, name, address in rows)
+
+    @classmethod
+    def match_flags(cls, locations: list, place_ids: set, hashes: set) -> list:
+        keys = [cls.lookup_keys(location) for location in locations]
+        return [place_id in place_ids or key in hashes for place_id, key in keys]
+
+    @classmethod
+    def visited_flags(cls, user, locations: list) -> list:
+        """Whether the user visited each location, in order, from one indexed query."""
+        keys = [cls.lookup_keys(location) for location in locations]
+        place_ids, hashes = cls.collect_keys(keys)
+        if not place_ids and not hashes:
+            return [False] * len(keys)
+
+        # Rows not yet backfilled (empty location_hash) are hashed here instead
+        visited = cls.objects.filter(user=user).filter(
+            Q(place_id__in=place_ids) | Q(location_hash__in=hashes) | Q(location_hash='')
+        ).values_list('place_id', 'location_hash', 'name', 'address')
+        return cls.match_flags(locations, *cls.collect_keys(
+            (place_id, key or location_hash(name, address)) for place_id, key, name, address in visited
+        ))
 
     def __str__(self):
         return f"{self.user.username} visited {self.name} on {self.date_visited}"
+
+
+class VisitDailyRollup(models.Model):
+    """
+    Visits per user per day (in TIME_ZONE), kept in step with VisitedLocation
+    by visited.signals while VISIT_ROLLUPS_ENABLED is set. Rebuild it with
+    `manage.py rebuild_visit_rollups` after enabling or after bulk writes.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='visit_rollups')
+    day = models.DateField()
+    visits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_visit_rollup'),
+        ]
+        ordering = ['day']
+
+    @classmethod
+    def add(cls, user_id, day, delta: int):
+        """Adjust one day's count, creating the row on first use and dropping it at zero."""
+        rollups = cls.objects.filter(user_id=user_id, day=day)
+        if delta < 0:
+            if not rollups.filter(visits__lte=-delta).delete()[0]:
+                rollups.update(visits=F('visits') + delta)
+        elif not rollups.update(visits=F('visits') + delta):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(user_id=user_id, day=day, visits=delta)
+            except IntegrityError:  # Created concurrently
+                rollups.update(visits=F('visits') + delta)
+
+    @classmethod
+    def refresh(cls, user_id, days):
+        """Recount some of a user's days from their visits, after writes that bypass signals."""
+        days = set(days)
+        counts = (
+            VisitedLocation.objects.filter(user_id=user_id)
+            .annotate(day=TruncDate('date_visited')).filter(day__in=days)
+            .values('day').annotate(visits=models.Count('id')).order_by()
+        )
+        with transaction.atomic():
+            cls.objects.filter(user_id=user_id, day__in=days).delete()
+            cls.objects.bulk_create([cls(user_id=user_id, **row) for row in counts])
+
+    def __str__(self):
+        return f"{self.user_id} {self.day}: {self.visits}"
@@ -5,9 +5,17 @@ class VisitedLocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = VisitedLocation
         fields = [
-            'id', 'name', 'address', 'lat', 'lng', 
+            'id', 'place_id', 'name', 'address', 'lat', 'lng',
             'rating', 'user_ratings_total', 'price_level',
             'types', 'description', 'recommendation_reason',
-            'photo_url', 'date_visited', 'notes'
+            'photo_url', 'date_visited', 'date_updated', 'notes'
         ]
-        read_only_fields = ['date_visited'] 
\ No newline at end of file
+        read_only_fields = ['date_visited', 'date_updated']
+
+
+class VisitImportSerializer(VisitedLocationSerializer):
+    """Validates one imported visit; unlike the regular API it keeps the visit's own date."""
+    date_visited = serializers.DateTimeField(required=False)
+
+    class Meta(VisitedLocationSerializer.Meta):
+        read_only_fields = ['date_updated']
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from . import cache
+from .models import VisitedLocation, VisitDailyRollup
+
+
+def visit_day(visit):
+    return timezone.localdate(visit.date_visited)
+
+
+@receiver(post_save, sender=VisitedLocation)
+def count_visit(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and settings.VISIT_ROLLUPS_ENABLED:
+        VisitDailyRollup.add(instance.user_id, visit_day(instance), 1)
+
+
+@receiver(post_delete, sender=VisitedLocation)
+def uncount_visit(sender, instance, **kwargs):
+    if settings.VISIT_ROLLUPS_ENABLED:
+        VisitDailyRollup.add(instance.user_id, visit_day(instance), -1)
+
+
+@receiver(post_save, sender=VisitedLocation)
+def cache_visit(sender, instance, raw=False, **kwargs):
+    if not raw and settings.VISITED_CACHE_ENABLED:
+        transaction.on_commit(lambda: cache.invalidate(instance.user_id))
+
+
+@receiver(post_delete, sender=VisitedLocation)
+def uncache_visit(sender, instance, **kwargs):
+    if settings.VISITED_CACHE_ENABLED:
+        transaction.on_commit(lambda: cache.invalidate(instance.user_id))
@@ -1,3 +1,262 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from weats_backend.testing import QueryBudgetMixin
+from . import cache
+from .models import VisitedLocation, VisitDailyRollup
 
-# Create your tests here.
+User = get_user_model()
+
+
+def location(i: int) -> dict:
+    return {
+        "name": f"Restaurant {i}",
+        "address": f"{i} Test Street",
+        "lat": 14.55,
+        "lng": 121.02,
+        "rating": 4.5,
+        "types": ["restaurant"],
+    }
+
+
+class VisitedLocationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        self.user = User.objects.create_user(email="eater@example.com", username="eater", password="password123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def seed_visits(self, size: int):
+        """Bring the user's history to `size` visits."""
+        start = VisitedLocation.objects.filter(user=self.user).count()
+        VisitedLocation.objects.bulk_create([
+            VisitedLocation(user=self.user, **location(i)) for i in range(start, size)
+        ])
+
+    def test_list_query_count_is_constant(self):
+        request = lambda: self.client.get("/api/visited/")
+        self.assertConstantQueries(self.seed_visits, request, limit=3)
+        self.assertEqual(request().data["count"], 100)
+
+    def test_pages_are_read_from_an_index(self):
+        pages = VisitedLocation.objects.filter(user=self.user).order_by('-date_visited', '-id')
+        self.assertIndexedOrdering(pages[:21])
+
+    def test_recent_visits_query_count_is_constant(self):
+        request = lambda: self.client.get("/api/visited/recent_visits/")
+        self.assertConstantQueries(self.seed_visits, request, limit=3)
+
+        response = request()
+        self.assertEqual(response.data["statistics"]["total_visits"], 100)
+        self.assertEqual(len(response.data["recent_visits"]), 20)
+        self.assertIsNotNone(response.data["next"])
+
+    def visit_days_ago(self, i: int, days: int):
+        visit = self.client.post("/api/visited/", location(i), format="json").data
+        VisitedLocation.objects.filter(pk=visit["id"]).update(date_visited=timezone.now() - timedelta(days=days))
+
+    def statistics(self, days=7):
+        return self.client.get("/api/visited/recent_visits/", {"days": days}).data["statistics"]
+
+    def test_recent_visits_statistics(self):
+        for i, days in enumerate([0, 0, 2, 10]):
+            self.visit_days_ago(i, days)
+
+        statistics = self.statistics()
+        self.assertEqual(statistics["total_visits"], 3)
+        self.assertEqual([day["count"] for day in statistics["visits_by_day"]], [1, 2])
+        self.assertEqual(self.statistics(days=30)["total_visits"], 4)
+        self.assertEqual(self.client.get("/api/visited/recent_visits/", {"days": "x"}).status_code, 400)
+
+    @override_settings(VISIT_ROLLUPS_ENABLED=True)
+    def test_daily_rollups_follow_writes(self):
+        body = {"location": location(1)}
+        for i in range(3):
+            self.client.post("/api/visited/", location(i + 2), format="json")
+        self.client.post("/api/visited/toggle_visited/", body, format="json")
+        self.client.post("/api/visited/toggle_visited/", body, format="json")
+        self.assertEqual(VisitDailyRollup.objects.get(user=self.user).visits, 3)
+        self.assertEqual(self.statistics()["total_visits"], 3)
+
+        self.visit_days_ago(9, 2)  # Moved by a bulk update, which the rollups miss until rebuilt
+        call_command("rebuild_visit_rollups", stdout=io.StringIO())
+        self.assertEqual([day["count"] for day in self.statistics()["visits_by_day"]], [1, 3])
+
+    def test_toggle_and_check_visited(self):
+        body = {"location": location(1)}
+        response = self.assertMaxQueries(3, lambda: self.client.post("/api/visited/toggle_visited/", body, format="json"))
+        self.assertEqual(response.status_code, 201)
+
+        checked = self.assertMaxQueries(1, lambda: self.client.post("/api/visited/check_visited/", body, format="json"))
+        self.assertTrue(checked.data["is_visited"])
+
+        response = self.client.post("/api/visited/toggle_visited/", body, format="json")
+        self.assertFalse(response.data["is_visited"])
+        self.assertFalse(self.client.post("/api/visited/check_visited/", body, format="json").data["is_visited"])
+
+    def test_visits_without_a_location_hash_are_still_found(self):
+        self.seed_visits(2)
+        VisitedLocation.objects.update(location_hash="")  # As rows saved before the column existed
+        body = {"location": location(1)}
+        self.assertTrue(self.client.post("/api/visited/check_visited/", body, format="json").data["is_visited"])
+        batch = {"locations": [location(0), location(5)]}
+        for cached in (False, True):
+            with self.settings(VISITED_CACHE_ENABLED=cached):
+                response = self.client.post("/api/visited/check_visited_batch/", batch, format="json")
+                self.assertEqual(response.data["is_visited"], [True, False])
+
+    def test_check_visited_batch(self):
+        self.client.post("/api/visited/", dict(location(1), place_id="place-1"), format="json")
+        self.client.post("/api/visited/", location(2), format="json")
+        VisitedLocation.objects.create(user=User.objects.create_user(
+            email="other@example.com", username="other", password="password123"
+        ), **location(3))
+
+        locations = [
+            {"place_id": "place-1"},
+            {"name": " restaurant 2", "address": "2 TEST street"},
+            {"place_id": "place-3", **location(3)},
+            {"location_hash": VisitedLocation.objects.get(name="Restaurant 2").location_hash},
+            {},
+        ]
+        response = self.assertMaxQueries(1, lambda: self.client.post(
+            "/api/visited/check_visited_batch/", {"locations": locations}, format="json"
+        ))
+        self.assertEqual(response.data["is_visited"], [True, True, False, True, False])
+
+        too_many = {"locations": [{"place_id": str(i)} for i in range(101)]}
+        self.assertEqual(self.client.post("/api/visited/check_visited_batch/", too_many, format="json").status_code, 400)
+
+    def test_bulk_paths_and_backfill_set_location_hashes(self):
+        self.seed_visits(2)
+        self.assertNotIn("", VisitedLocation.objects.values_list("location_hash", flat=True))
+
+        VisitedLocation.objects.update(location_hash="")  # As rows saved before the column existed
+        out = io.StringIO()
+        call_command("backfill_location_hashes", stdout=out)
+        self.assertIn("Hashed 2 visits of 1 users", out.getvalue())
+        body = {"locations": [{"name": "restaurant 1", "address": "1 test street"}]}
+        response = self.client.post("/api/visited/check_visited_batch/", body, format="json")
+        self.assertEqual(response.data["is_visited"], [True])
+
+    @override_settings(VISITED_CACHE_ENABLED=True)
+    def test_visited_set_is_cached_and_invalidated_on_write(self):
+        body = {"locations": [location(1), location(2)]}
+        check = lambda: self.client.post("/api/visited/check_visited_batch/", body, format="json").data["is_visited"]
+        self.assertEqual(check(), [False, False])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/visited/toggle_visited/", {"location": location(1)}, format="json")
+            visit = self.client.post("/api/visited/", location(2), format="json").data
+        self.assertEqual(self.assertMaxQueries(1, check), [True, True])
+        self.assertEqual(self.assertMaxQueries(0, check), [True, True])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/visited/toggle_visited/", {"location": location(1)}, format="json")
+            self.client.delete(f"/api/visited/{visit['id']}/")
+        self.assertEqual(self.assertMaxQueries(1, check), [False, False])
+
+    @override_settings(VISITED_CACHE_ENABLED=True)
+    def test_a_stale_load_is_not_served_after_a_write(self):
+        stale = VisitedLocation.visited_keys(self.user.id)  # Read before the visit below commits
+        version = cache.current_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/visited/", location(1), format="json")
+        caches["shared"].set(cache.cache_key(self.user.id, version), stale)  # ... and stored after it
+
+        body = {"locations": [location(1)]}
+        response = self.client.post("/api/visited/check_visited_batch/", body, format="json")
+        self.assertEqual(response.data["is_visited"], [True])
+
+    def test_import_visits(self):
+        self.client.post("/api/visited/", location(0), format="json")
+        visits = [location(i) for i in range(5)] + [location(3), {"name": "No address"}]
+        visits[1]["date_visited"] = "2024-05-01T12:00:00Z"
+
+        # Per chunk: a lookup of its keys, the INSERT and a re-read of its keys (plus a savepoint)
+        response = self.assertMaxQueries(5, lambda: self.client.post(
+            "/api/visited/import_visits/", {"visits": visits}, format="json"
+        ))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["skipped"]), (4, 2))
+        self.assertEqual([error["index"] for error in response.data["errors"]], [6])
+
+        imported = VisitedLocation.objects.get(name="Restaurant 1")
+        self.assertEqual(imported.date_visited.year, 2024)
+        self.assertTrue(imported.location_hash)
+        check = self.client.post("/api/visited/check_visited_batch/", {"locations": [location(4)]}, format="json")
+        self.assertEqual(check.data["is_visited"], [True])
+
+    def test_import_counts_only_the_rows_it_inserted(self):
+        bulk_create = VisitedLocation.objects.bulk_create
+
+        def racing_bulk_create(visits, **kwargs):
+            # Another request saves one of the visits between the lookup and the INSERT
+            VisitedLocation.objects.get_or_create(user=self.user, **location(2))
+            return bulk_create(visits, **kwargs)
+
+        visits = [location(i) for i in range(4)]
+        with mock.patch("visited.views.IMPORT_CHUNK_SIZE", 3), \
+                mock.patch.object(VisitedLocation.objects, "bulk_create", side_effect=racing_bulk_create):
+            response = self.client.post("/api/visited/import_visits/", {"visits": visits}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["skipped"]), (3, 1))
+        self.assertEqual(VisitedLocation.objects.filter(user=self.user).count(), 4)
+
+    @override_settings(VISIT_ROLLUPS_ENABLED=True)
+    def test_import_updates_rollups(self):
+        visits = [dict(location(i), date_visited=f"2024-05-0{i + 1}T12:00:00Z") for i in range(3)]
+        self.client.post("/api/visited/import_visits/", {"visits": visits + [location(3)]}, format="json")
+        self.assertEqual(VisitDailyRollup.objects.filter(user=self.user).count(), 4)
+
+    def test_export(self):
+        self.seed_visits(3)
+        response = self.client.get("/api/visited/export/", {"output": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(json.loads(rows[0]["types"]), ["restaurant"])
+
+        export = lambda: b"".join(self.client.get("/api/visited/export/").streaming_content)
+        self.assertConstantQueries(self.seed_visits, export, limit=1)
+        self.assertEqual(len(export().splitlines()), 100)
+
+    async def test_export_streams_in_chunks_under_asgi(self):
+        await sync_to_async(self.seed_visits)(5)
+        token = (await sync_to_async(RefreshToken.for_user)(self.user)).access_token
+        with mock.patch("weats_backend.export.EXPORT_CHUNK_SIZE", 2):
+            response = await self.async_client.get(
+                "/api/visited/export/", headers={"Authorization": f"Bearer {token}"}
+            )
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual([len(chunk.splitlines()) for chunk in chunks], [2, 2, 1])
+
+    def test_create_retrieve_and_delete(self):
+        response = self.client.post("/api/visited/", location(1), format="json")
+        self.assertEqual(response.status_code, 201)
+        url = f"/api/visited/{response.data['id']}/"
+
+        self.assertEqual(self.assertMaxQueries(1, lambda: self.client.get(url)).data["name"], "Restaurant 1")
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(VisitedLocation.objects.exists())
+
+    def test_visits_are_private(self):
+        self.seed_visits(3)
+        other = User.objects.create_user(email="other@example.com", username="other", password="password123")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get("/api/visited/").data["results"], [])
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/visited/").status_code, 401)
@@ -2,15 +2,39 @@ from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-from .models import VisitedLocation
-from .serializers import VisitedLocationSerializer
-from django.db.models import Count
-from datetime import datetime, timedelta
+from . import cache
+from .models import VisitedLocation, VisitDailyRollup
+from .serializers import VisitedLocationSerializer, VisitImportSerializer
+from weats_backend.export import EXPORT_FORMATS, EXPORT_CHUNK_SIZE, export_response
+from weats_backend.pagination import VisitCursorPagination
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+
+MAX_BATCH_LOOKUP = 100  # Locations per check_visited_batch request
+MAX_IMPORT_VISITS = 1000  # Visits per import_visits request
+IMPORT_CHUNK_SIZE = 200  # Rows per INSERT
+
+
+def daily_visits(user, first_day, start_date) -> list:
+    """[{'day', 'count'}] from first_day on, oldest first."""
+    if settings.VISIT_ROLLUPS_ENABLED:
+        rollups = VisitDailyRollup.objects.filter(user=user, day__gte=first_day)
+        return list(rollups.values('day', count=F('visits')).order_by('day'))
+    visits = VisitedLocation.objects.filter(user=user, date_visited__gte=start_date)
+    return list(
+        visits.annotate(day=TruncDate('date_visited')).values('day').annotate(count=Count('id')).order_by('day')
+    )
 
 class VisitedLocationViewSet(viewsets.ModelViewSet):
     serializer_class = VisitedLocationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = VisitCursorPagination
 
     def get_queryset(self):
         return VisitedLocation.objects.filter(user=self.request.user)
@@ -22,36 +46,48 @@ class VisitedLocationViewSet(viewsets.ModelViewSet):
     def recent_visits(self, request):
         """
         Get recently visited locations with visit counts and statistics.
+        The statistics cost one row per day; the visits themselves are paginated.
         """
-        # Get time range from query params (default to last 30 days)
-        days = int(request.query_params.get('days', 30))
-        start_date = datetime.now() - timedelta(days=days)
+        # Get time range from query params (default to the last 30 days, today included)
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= settings.RECENT_VISITS_MAX_DAYS:
+            return Response(
+                {'error': f'days must be an integer between 1 and {settings.RECENT_VISITS_MAX_DAYS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        first_day = timezone.localdate() - timedelta(days=days - 1)
+        start_date = timezone.make_aware(datetime.combine(first_day, time.min))
 
         # Get visited locations in the time range
         recent_visits = VisitedLocation.objects.filter(
             user=request.user,
             date_visited__gte=start_date
-        ).order_by('-date_visited')
+        ).order_by('-date_visited', '-id')
 
         # Get visit statistics
-        total_visits = recent_visits.count()
-        visits_by_day = recent_visits.extra(
-            select={'day': 'date(date_visited)'}
-        ).values('day').annotate(count=Count('id')).order_by('day')
+        visits_by_day = daily_visits(request.user, first_day, start_date)
+        total_visits = sum(day['count'] for day in visits_by_day)
 
         # Get most visited locations
         most_visited = recent_visits.values('name', 'address').annotate(
             visit_count=Count('id')
         ).order_by('-visit_count')[:5]
 
-        # Serialize the data
-        serializer = self.get_serializer(recent_visits, many=True)
+        # Serialize one page of the visits; the total above makes a count redundant
+        self.paginator.include_count = False
+        page = self.paginate_queryset(recent_visits)
+        serializer = self.get_serializer(page, many=True)
 
         return Response({
             'recent_visits': serializer.data,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
             'statistics': {
                 'total_visits': total_visits,
-                'visits_by_day': list(visits_by_day),
+                'visits_by_day': visits_by_day,
                 'most_visited': list(most_visited),
                 'time_range': f'Last {days} days'
             }
@@ -85,6 +121,27 @@ class VisitedLocationViewSet(viewsets.ModelViewSet):
                 'is_visited': False
             })
 
+    @action(detail=False, methods=['post'])
+    def check_visited_batch(self, request):
+        """
+        Check which of a list of locations the current user visited, from the
+        cached visited set (or one indexed query when it is disabled). Each location is matched by place_id, or by name and address (or their
+        location_hash). Flags come back in the order the locations were sent.
+        """
+        locations = request.data.get('locations')
+        if not isinstance(locations, list) or not all(isinstance(location, dict) for location in locations):
+            return Response(
+                {'error': 'locations must be a list of objects'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(locations) > MAX_BATCH_LOOKUP:
+            return Response(
+                {'error': f'At most {MAX_BATCH_LOOKUP} locations can be checked at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({'is_visited': cache.visited_flags(request.user, locations)})
+
     @action(detail=False, methods=['post'])
     def toggle_visited(self, request):
         """
@@ -119,6 +176,7 @@ class VisitedLocationViewSet(viewsets.ModelViewSet):
             # If not found, create new visited location
             visited_location = VisitedLocation.objects.create(
                 user=request.user,
+                place_id=location_data.get('place_id'),
                 name=location_data.get('name'),
                 address=location_data.get('address'),
                 lat=location_data.get('lat'),
@@ -137,4 +195,84 @@ class VisitedLocationViewSet(viewsets.ModelViewSet):
                 'message': 'Location added to visited list',
                 'is_visited': True,
                 'data': serializer.data
-            }, status=status.HTTP_201_CREATED)
\ No newline at end of file
+            }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def import_visits(self, request):
+        """
+        Import many past visits at once, e.g. from another app. Visits whose
+        name and address the user already has are skipped. Invalid entries are
+        reported by their index in `visits` and the rest are still imported.
+        """
+        visits = request.data.get('visits')
+        if not isinstance(visits, list):
+            return Response(
+                {'error': 'visits must be a list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(visits) > MAX_IMPORT_VISITS:
+            return Response(
+                {'error': f'At most {MAX_IMPORT_VISITS} visits can be imported at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = VisitImportSerializer()
+        new_visits, errors = [], []
+        for index, visit in enumerate(visits):
+            try:
+                new_visits.append(VisitedLocation(user=request.user, **serializer.run_validation(visit)))
+            except ValidationError as e:
+                errors.append({'index': index, 'errors': e.detail})
+
+        # bulk_create skips the signals that keep rollups and the visited cache in step
+        user_visits = VisitedLocation.objects.filter(user=request.user)
+        created = 0
+        for start in range(0, len(new_visits), IMPORT_CHUNK_SIZE):
+            chunk = new_visits[start:start + IMPORT_CHUNK_SIZE]
+            names = {visit.name for visit in chunk}
+            keys = {(visit.name, visit.address) for visit in chunk}
+            with transaction.atomic():
+                existing = set(user_visits.filter(name__in=names).values_list('name', 'address')) & keys
+                to_insert = [visit for visit in chunk if (visit.name, visit.address) not in existing]
+                VisitedLocation.objects.bulk_create(to_insert, ignore_conflicts=True)
+                # Re-read the keys: a row a concurrent request inserted first was skipped, and has
+                # another date_updated than the one bulk_create stamped on ours
+                ours = {(visit.name, visit.address, visit.date_updated) for visit in to_insert}
+                inserted = {
+                    (name, address)
+                    for name, address, date_updated in user_visits.filter(name__in=names).values_list(
+                        'name', 'address', 'date_updated'
+                    )
+                    if (name, address, date_updated) in ours
+                }
+                created += len(inserted)
+                if inserted and settings.VISIT_ROLLUPS_ENABLED:
+                    VisitDailyRollup.refresh(request.user.id, {
+                        timezone.localdate(visit.date_visited) for visit in chunk if (visit.name, visit.address) in inserted
+                    })
+        if created:
+            cache.invalidate(request.user.id)
+
+        return Response({
+            'created': created,
+            'skipped': len(new_visits) - created,
+            'errors': errors
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the user's whole visit history, newest first, as NDJSON or CSV
+        (`?output=ndjson|csv`).
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'error': f'output must be one of {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        visits = self.get_queryset().order_by('-date_visited', '-id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        serializer = VisitedLocationSerializer()
+        rows = (serializer.to_representation(visit) for visit in visits)
+        return export_response(request, rows, output, tuple(VisitedLocationSerializer.Meta.fields), 'visits')
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Serve it with an ASGI worker so async views such as
+map.async_views.nearby_restaurants_async run on the event loop:
+
+    gunicorn weats_backend.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
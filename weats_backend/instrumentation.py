@@ -0,0 +1,206 @@
+"""
+Lightweight request instrumentation.
+
+Code marks the stages of a request (upstream calls, DB writes,
+serialization) with stage() or @timed. Each request's totals are sent back
+in a Server-Timing header by ServerTimingMiddleware, and every observation
+also feeds process-wide histograms that metrics_view exposes in the
+Prometheus text format, together with any registered Counters.
+"""
+import contextvars
+import functools
+import hmac
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+# Seconds; Prometheus adds +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a single label, safe to share between threads."""
+
+    def __init__(self, name: str, help: str, label: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label value -> [bucket counts..., count, sum]
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-2]}')
+            lines.append(f"{self.name}_count{{{label}}} {values[-2]}")
+            lines.append(f"{self.name}_sum{{{label}}} {values[-1]:.6f}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestTimings:
+    """Stage totals for one request. Stages running in parallel add up."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self, total: float) -> str:
+        with self._lock:
+            stages = list(self.stages.items())
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+stage_seconds = Histogram("weats_stage_duration_seconds", "Time spent in each request stage.", "stage")
+request_seconds = Histogram("weats_request_duration_seconds", "Request latency by route.", "route")
+_counters = {}
+
+
+def register_counters(prefix: str, counters):
+    """Expose a Counters instance on the metrics endpoint as <prefix>_<name>_total."""
+    _counters[prefix] = counters
+
+
+def record(stage: str, seconds: float):
+    stage_seconds.observe(stage, seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as one call of a stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """Decorator version of stage(), for plain and coroutine functions."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with stage(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit() that keeps recording stages into the submitting request."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ServerTimingMiddleware:
+    """
+    Collects the stages of each request into a Server-Timing header and the
+    request latency histogram. Streaming responses report the stages finished
+    before the first byte was sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    def finish(self, request, response, timings: RequestTimings, start: float):
+        total = time.perf_counter() - start
+        match = getattr(request, "resolver_match", None)
+        request_seconds.observe(match.route if match is not None else "unmatched", total)
+        if settings.SERVER_TIMING_ENABLED:
+            response["Server-Timing"] = timings.header(total)
+        return response
+
+
+def render_metrics() -> str:
+    lines = request_seconds.render() + stage_seconds.render()
+    for prefix, counters in sorted(_counters.items()):
+        for name, value in sorted(counters.snapshot().items()):
+            metric = f"{prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def metrics_allowed(request) -> bool:
+    """
+    Scrapers send `Authorization: Bearer <METRICS_TOKEN>`; staff can also look.
+    Without a token only DEBUG deployments are open.
+    """
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    if getattr(request, "user", None) is not None and request.user.is_staff:
+        return True
+    return bool(settings.DEBUG) and not token
+
+
+def metrics_view(request):
+    """Prometheus text exposition, for the callers metrics_allowed() lets in."""
+    if not metrics_allowed(request):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
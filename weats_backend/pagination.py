@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class HistoryCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's history, newest first. The id breaks ties
+    between rows saved in the same instant, so pages never skip or repeat
+    rows however long the history grows.
+    """
+    ordering = ('-date_created', '-id')
+    page_size_query_param = 'page_size'
+    include_count = True
+
+    def get_page_size(self, request):
+        self.page_size = settings.PAGINATION_PAGE_SIZE
+        self.max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Counting is the one part whose cost grows with the history, so it can be switched off
+        self.count = queryset.count() if self.include_count and settings.PAGINATION_INCLUDE_COUNT else None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_data(self, data) -> OrderedDict:
+        paginated = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            paginated['count'] = self.count
+        paginated['results'] = data
+        return paginated
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class VisitCursorPagination(HistoryCursorPagination):
+    ordering = ('-date_visited', '-id')
+
+
+class IdCursorPagination(HistoryCursorPagination):
+    """For tables without a creation date; the newest rows have the highest ids."""
+    ordering = ('-id',)
@@ -0,0 +1,105 @@
+"""
+Opt-in cProfile capture of single requests.
+
+ProfilerMiddleware is only installed when PROFILER_ENABLED is set (otherwise
+it raises MiddlewareNotUsed, so it costs nothing). A request is profiled when
+it carries `X-Profile: <PROFILER_TOKEN>` or is picked by PROFILER_SAMPLE_RATE.
+Profiles are pstats files in PROFILER_DIR, which keeps only the newest
+PROFILER_MAX_FILES; read them with `python -m pstats <file>` or snakeviz.
+
+cProfile sees the request's own thread only: work handed to the search and
+ranking executors shows up as time spent waiting on their futures. One request
+is profiled at a time; a request picked while another is being profiled is
+served without a profile (Python 3.12+ allows a single active profiler).
+"""
+import cProfile
+import hmac
+import os
+import random
+import re
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_HEADER = "X-Profile"
+
+_ring_lock = threading.Lock()
+_profiling = threading.Lock()  # Held while a request is profiled
+
+
+def should_profile(request) -> bool:
+    token = settings.PROFILER_TOKEN
+    supplied = request.headers.get(PROFILE_HEADER)
+    if token and supplied and hmac.compare_digest(supplied, token):
+        return True
+    return settings.PROFILER_SAMPLE_RATE > 0 and random.random() < settings.PROFILER_SAMPLE_RATE
+
+
+def profile_filename(request, seconds: float) -> str:
+    path = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_")[:80] or "root"
+    return f"{time.time_ns() // 1000}-{request.method}-{path}-{seconds * 1000:.0f}ms.prof"
+
+
+def save_profile(profiler: cProfile.Profile, filename: str):
+    """Write a profile and drop the oldest ones beyond PROFILER_MAX_FILES."""
+    directory = settings.PROFILER_DIR
+    with _ring_lock:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, filename))
+        profiles = sorted(name for name in os.listdir(directory) if name.endswith(".prof"))
+        for name in profiles[:max(len(profiles) - settings.PROFILER_MAX_FILES, 0)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not should_profile(request) or not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            _profiling.release()
+        return self.finish(request, response, profiler, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not should_profile(request) or not _profiling.acquire(blocking=False):
+            return await self.get_response(request)
+
+        # Profiles the event loop thread, so concurrent requests on it are included
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            _profiling.release()
+        return self.finish(request, response, profiler, time.perf_counter() - start)
+
+    def finish(self, request, response, profiler: cProfile.Profile, seconds: float):
+        filename = profile_filename(request, seconds)
+        save_profile(profiler, filename)
+        response["X-Profile-Id"] = filename
+        return response
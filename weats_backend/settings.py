@@ -86,6 +86,22 @@ REST_FRAMEWORK = {
     ),
 }
 
+# History list endpoints (weats_backend.pagination)
+PAGINATION_PAGE_SIZE = int(os.getenv("PAGINATION_PAGE_SIZE", 20))
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv("PAGINATION_MAX_PAGE_SIZE", 100))
+PAGINATION_INCLUDE_COUNT = os.getenv("PAGINATION_INCLUDE_COUNT", "True").lower() == "true"
+
+# recent_visits statistics: read per-day counts from VisitDailyRollup instead of aggregating visits.
+# Run `manage.py rebuild_visit_rollups` when turning this on.
+VISIT_ROLLUPS_ENABLED = os.getenv("VISIT_ROLLUPS_ENABLED", "False").lower() == "true"
+RECENT_VISITS_MAX_DAYS = int(os.getenv("RECENT_VISITS_MAX_DAYS", 365))
+
+# Delta sync (sync/views.py)
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", 200))  # Rows per stream per response
+SYNC_MAX_PAGE_SIZE = int(os.getenv("SYNC_MAX_PAGE_SIZE", 1000))
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", 2))  # Newer changes wait for the next sync
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", 90))  # Kept by prune_tombstones; older cursors get 410
+
 # JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=20),
@@ -127,10 +143,13 @@ INSTALLED_APPS = [
     'map',
     'user',
     'suggestions',
-    'visited'
+    'visited',
+    'sync',
 ]
 
 MIDDLEWARE = [
+    'weats_backend.instrumentation.ServerTimingMiddleware',
+    'weats_backend.profiling.ProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -173,6 +192,134 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", 60 * 60))  # 1 hour
+PLACES_CACHE_NEGATIVE_TTL = int(os.getenv("PLACES_CACHE_NEGATIVE_TTL", 60))
+PLACES_CACHE_GEOCELL_PRECISION = int(os.getenv("PLACES_CACHE_GEOCELL_PRECISION", 3))  # ~110m cells
+# Prompt rows are shared by every search in the same cell with the same normalized preferences
+PROMPT_GEOCELL_PRECISION = int(os.getenv("PROMPT_GEOCELL_PRECISION", PLACES_CACHE_GEOCELL_PRECISION))
+# Places results are also kept in the database (map.models.Place / CatalogCell)
+PLACES_CATALOG_ENABLED = os.getenv("PLACES_CATALOG_ENABLED", "True").lower() == "true"
+PLACES_CATALOG_FRESH_TTL = int(os.getenv("PLACES_CATALOG_FRESH_TTL", 24 * 60 * 60))  # served as is
+PLACES_CATALOG_MAX_STALE = int(os.getenv("PLACES_CATALOG_MAX_STALE", 7 * 24 * 60 * 60))  # served while refreshing
+PLACES_CATALOG_GEOCELL_PRECISION = int(os.getenv("PLACES_CATALOG_GEOCELL_PRECISION", 2))  # ~1.1km cells for nearby lookups
+RANKING_CACHE_TTL = int(os.getenv("RANKING_CACHE_TTL", 30 * 60))  # 30 minutes
+# Seconds a search waits for Gemini before answering with the local ranking
+RANKING_LATENCY_BUDGET = float(os.getenv("RANKING_LATENCY_BUDGET", 8))
+# Gemini calls a process runs or queues at once; searches beyond it use the local ranking
+RANKING_MAX_IN_FLIGHT = int(os.getenv("RANKING_MAX_IN_FLIGHT", 16))
+
+# Identical concurrent searches share one execution (see map/singleflight.py)
+SINGLEFLIGHT_LOCK_TTL = int(os.getenv("SINGLEFLIGHT_LOCK_TTL", 60))
+SINGLEFLIGHT_RESULT_TTL = int(os.getenv("SINGLEFLIGHT_RESULT_TTL", 10))
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT", 30))
+
+# Cache shared by all workers; needs the redis package when REDIS_URL is set
+REDIS_URL = os.getenv("REDIS_URL")
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+    'places': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'places',
+        'TIMEOUT': PLACES_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("PLACES_CACHE_MAX_ENTRIES", 2000)),
+        },
+    },
+    'ranking': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ranking',
+        'TIMEOUT': RANKING_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("RANKING_CACHE_MAX_ENTRIES", 500)),
+        },
+    },
+}
+
+
+# Per-user visited sets in the "shared" cache (visited/cache.py). Writes only reach other
+# workers through Redis, so it is off by default with the per-process LocMemCache
+VISITED_CACHE_ENABLED = os.getenv("VISITED_CACHE_ENABLED", str(bool(REDIS_URL))).lower() == "true"
+VISITED_CACHE_TTL = int(os.getenv("VISITED_CACHE_TTL", 10 * 60))  # 10 minutes
+
+# Upstream HTTP clients (Google Places, Vertex AI, OAuth), see weats_backend/upstream.py
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05))  # seconds
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 10))
+UPSTREAM_LLM_TIMEOUT = float(os.getenv("UPSTREAM_LLM_TIMEOUT", 60))
+UPSTREAM_POOL_HOSTS = int(os.getenv("UPSTREAM_POOL_HOSTS", 10))
+UPSTREAM_POOL_PER_HOST = int(os.getenv("UPSTREAM_POOL_PER_HOST", 20))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "False").lower() == "true"  # needs the h2 package
+
+# Instrumentation (weats_backend/instrumentation.py)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "True").lower() == "true"
+# metrics/ takes "Authorization: Bearer <token>" or a staff session; without a token only DEBUG serves it openly
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Request profiling (weats_backend/profiling.py); when disabled the middleware is not installed
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "False").lower() == "true"
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")  # Requests with "X-Profile: <token>" are always profiled
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", 0.0))
+PROFILER_DIR = os.getenv("PROFILER_DIR", str(BASE_DIR / "profiles"))
+PROFILER_MAX_FILES = int(os.getenv("PROFILER_MAX_FILES", 50))
+
+# Logging: JSON lines by default; DEBUG/INFO records can be sampled under load, warnings never are
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample': {
+            '()': 'weats_backend.log.SampleFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'weats_backend.log.JSONFormatter',
+        },
+        'text': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['sample'],
+        },
+    },
+    'loggers': {
+        app: {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        }
+        for app in ('map', 'suggestions', 'user', 'visited', 'weats_backend')
+    },
+}
+
+# Upstream endpoints; manage.py bench_search points these at local stand-ins
+PLACES_API_URL = os.getenv("PLACES_API_URL", "https://places.googleapis.com/v1/places:searchText")
+GENAI_BASE_URL = os.getenv("GENAI_BASE_URL")  # None uses the SDK default
+GENAI_API_KEY = os.getenv("GENAI_API_KEY")  # Use the Gemini API with this key instead of Vertex AI
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
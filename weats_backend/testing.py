@@ -0,0 +1,184 @@
+import json
+from contextlib import contextmanager
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# History sizes the growth assertions seed, smallest first
+HISTORY_SIZES = (1, 10, 100)
+
+
+class QueryBudgetMixin:
+    """
+    Assertions on how many SQL queries a request makes, and on how its query
+    count and upstream calls change as the data behind it grows.
+    """
+
+    def count_queries(self, request) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            request()
+        return len(queries.captured_queries)
+
+    def assertMaxQueries(self, limit: int, request):
+        with CaptureQueriesContext(connection) as queries:
+            result = request()
+        executed = len(queries.captured_queries)
+        self.assertLessEqual(
+            executed, limit,
+            f"{executed} queries executed, expected at most {limit}:\n"
+            + "\n".join(query["sql"] for query in queries.captured_queries)
+        )
+        return result
+
+    def assertIndexedOrdering(self, queryset):
+        """The database reads the rows in order from an index rather than sorting them (SQLite only)."""
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plans are checked on SQLite")
+        plan = queryset.explain()
+        self.assertNotIn("TEMP B-TREE", plan, f"Rows are sorted for every page:\n{plan}")
+
+    def measure_growth(self, seed, request, sizes=HISTORY_SIZES, counters=None) -> list:
+        """
+        Seed up to each history size in turn and run the request there.
+        seed(n) must bring the history to n rows. `counters` maps names to
+        callables returning running totals (e.g. FakePlaces.calls). Returns
+        (size, {"queries": n, <counter>: delta, ...}) pairs.
+        """
+        counters = counters or {}
+        measurements = []
+        for size in sizes:
+            seed(size)
+            before = {name: counter() for name, counter in counters.items()}
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            work = {"queries": len(queries.captured_queries)}
+            work.update((name, counter() - before[name]) for name, counter in counters.items())
+            measurements.append((size, work))
+        return measurements
+
+    def assertConstantQueries(self, seed, request, sizes=HISTORY_SIZES, limit: int = None, counters=None):
+        """
+        The query count, and the work behind any `counters`, does not depend on
+        the history size (no N+1). Counts rather than timings, so it is not flaky.
+        """
+        measurements = self.measure_growth(seed, request, sizes, counters)
+        self.assertEqual(
+            len({tuple(sorted(work.items())) for size, work in measurements}), 1,
+            f"Work grows with history: {measurements}"
+        )
+        if limit is not None:
+            self.assertLessEqual(measurements[0][1]["queries"], limit)
+        return measurements
+
+
+def places_page(count: int, offset: int = 0, next_page_token: str = None) -> dict:
+    """A Places text search response body with `count` restaurants."""
+    body = {
+        "places": [
+            {
+                "id": f"place-{offset + i}",
+                "displayName": {"text": f"Restaurant {offset + i}"},
+                "formattedAddress": f"{offset + i} Test Street",
+                "location": {"latitude": 14.55 + i / 1000, "longitude": 121.02 + i / 1000},
+                "rating": 4.0 + (i % 10) / 10,
+                "userRatingCount": 10 * (i + 1),
+                "priceLevel": "PRICE_LEVEL_MODERATE",
+                "types": ["restaurant", "ramen_restaurant" if i % 2 else "cafe"],
+                "photos": [],
+            }
+            for i in range(count)
+        ]
+    }
+    if next_page_token:
+        body["nextPageToken"] = next_page_token
+    return body
+
+
+class FakePlacesResponse:
+    def __init__(self, body: dict, status_code: int = 200):
+        self.status_code = status_code
+        self._body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+
+class FakePlaces:
+    """
+    Offline stand-in for the Places text search endpoint, for both the
+    requests session (map.views.get_session) and the httpx client
+    (map.async_views.get_async_client). Every query returns `pages` pages
+    of `per_query` restaurants; each page token is rejected as not ready
+    (400 INVALID_ARGUMENT) `not_ready` times before it is served.
+    """
+
+    def __init__(self, per_query: int = 20, pages: int = 1, not_ready: int = 0):
+        self.per_query = per_query
+        self.pages = pages
+        self.not_ready = not_ready
+        self.rejected = {}
+        self.calls = []
+
+    def respond(self, json=None, **kwargs):
+        self.calls.append(json)
+        body = json or {}
+        if "pageToken" in body:
+            token = body["pageToken"]
+            if self.rejected.get(token, 0) < self.not_ready:
+                self.rejected[token] = self.rejected.get(token, 0) + 1
+                return FakePlacesResponse({"error": {"status": "INVALID_ARGUMENT"}}, status_code=400)
+            query, page = token.rsplit(":", 1)
+            page = int(page)
+        else:
+            query, page = body.get("textQuery", ""), 0
+        # Each query gets its own ids so merged tiers do not collapse into one page
+        offset = 1000 * (sum(map(ord, query)) % 97) + page * self.per_query
+        next_page_token = f"{query}:{page + 1}" if page + 1 < self.pages else None
+        return FakePlacesResponse(places_page(self.per_query, offset=offset, next_page_token=next_page_token))
+
+    def post(self, url, **kwargs):
+        return self.respond(**kwargs)
+
+    async def apost(self, url, **kwargs):
+        return self.respond(**kwargs)
+
+    @contextmanager
+    def patch(self):
+        """Route both HTTP clients to this fake."""
+        async_client = mock.Mock(post=self.apost)
+        with mock.patch("map.views.get_session", lambda: self), \
+                mock.patch("map.async_views.get_async_client", lambda url: async_client):
+            yield self
+
+
+class FakeGemini:
+    """
+    Offline stand-in for the Gemini client: ranks the candidates in the order
+    given, with fixed descriptions.
+    """
+
+    def __init__(self, count: int = 10):
+        self.count = count
+        self.calls = 0
+        self.models = mock.Mock(generate_content=self.generate_content)
+        self.aio = mock.Mock()
+        self.aio.models = mock.Mock(generate_content=self.agenerate_content)
+
+    def generate_content(self, **kwargs):
+        self.calls += 1
+        ranking = [
+            {"id": i + 1, "rank": i + 1, "description": "Ranked by the stub", "reason": "Matches the prompt"}
+            for i in range(self.count)
+        ]
+        return mock.Mock(text=json.dumps(ranking))
+
+    async def agenerate_content(self, **kwargs):
+        return self.generate_content(**kwargs)
+
+    @contextmanager
+    def patch(self):
+        with mock.patch("map.views.get_genai_client", lambda: self), \
+                mock.patch("map.async_views.get_async_genai_client", lambda: self.aio):
+            yield self
+
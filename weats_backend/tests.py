@@ -0,0 +1,82 @@
+import asyncio
+import os
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from django.test.client import Client
+from . import profiling, upstream
+
+
+class ProfilerMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def get(self, **headers):
+        # A new client builds a new handler, so the middleware sees the overridden settings
+        return Client().get("/metrics/", headers=headers)
+
+    def test_profiles_requests_with_the_token(self):
+        with self.settings(PROFILER_ENABLED=True, PROFILER_TOKEN="secret", PROFILER_DIR=self.dir):
+            self.assertNotIn("X-Profile-Id", self.get())
+            self.assertNotIn("X-Profile-Id", self.get(X_Profile="wrong"))
+            response = self.get(X_Profile="secret")
+
+        filename = response["X-Profile-Id"]
+        self.assertIn("-GET-metrics-", filename)
+        self.assertEqual(os.listdir(self.dir), [filename])
+
+    def test_keeps_only_the_newest_profiles(self):
+        with self.settings(PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=1.0, PROFILER_DIR=self.dir, PROFILER_MAX_FILES=3):
+            names = [self.get()["X-Profile-Id"] for _ in range(5)]
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(names)[-3:])
+
+    def test_skips_while_another_request_is_profiled(self):
+        with self.settings(PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=1.0, PROFILER_DIR=self.dir):
+            with profiling._profiling:
+                self.assertNotIn("X-Profile-Id", self.get())
+            self.assertIn("X-Profile-Id", self.get())
+
+    @override_settings(PROFILER_ENABLED=False, PROFILER_SAMPLE_RATE=1.0)
+    def test_not_installed_when_disabled(self):
+        self.assertNotIn("X-Profile-Id", self.get())
+
+
+async def noop(value):
+    pass
+
+
+class LoopLocalTests(SimpleTestCase):
+    def test_values_are_kept_per_event_loop(self):
+        async def values():
+            return upstream.loop_local("test", object, close=noop), upstream.loop_local("test", object, close=noop)
+
+        first, again = asyncio.run(values())
+        self.assertIs(first, again)
+        second, _ = asyncio.run(values())
+        self.assertIsNot(first, second)
+        self.assertEqual(upstream._loop_locals, {})  # Dropped as each loop shut down
+
+    def test_values_are_closed_with_their_loop(self):
+        closed = []
+
+        async def close(value):
+            closed.append(value)
+
+        async def value():
+            return upstream.loop_local("test", object, close=close)
+
+        made = asyncio.run(value())
+        self.assertEqual(closed, [made])
+
+
+class GoogleAuthRequestTests(SimpleTestCase):
+    @override_settings(UPSTREAM_CONNECT_TIMEOUT=1.5, UPSTREAM_READ_TIMEOUT=4)
+    def test_uses_the_configured_timeouts(self):
+        with mock.patch.object(upstream.get_session(), "request") as request:
+            request.return_value.status_code = 200
+            request.return_value.headers = {}
+            request.return_value.content = b"{}"
+            upstream.google_auth_request()("https://www.googleapis.com/oauth2/v1/certs")
+        self.assertEqual(request.call_args.kwargs["timeout"], (1.5, 4))
@@ -0,0 +1,139 @@
+"""
+Process-wide HTTP clients for upstream Google APIs.
+
+Sync code shares one pooled requests.Session (urllib3 keeps a keep-alive
+pool per host) and async code shares httpx.AsyncClients, one per event loop
+and host. Every request gets the configured timeouts by default.
+"""
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit
+import httpx
+import requests
+from google.auth.transport import requests as google_requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_loop_locals = {}  # id(loop) -> (loop, {name: (value, close)}, closer)
+_loop_locals_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def get_session() -> requests.Session:
+    """Shared keep-alive session for sync upstream calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = TimeoutSession((settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT))
+                adapter = HTTPAdapter(
+                    pool_connections=settings.UPSTREAM_POOL_HOSTS,
+                    pool_maxsize=settings.UPSTREAM_POOL_PER_HOST,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class GoogleAuthRequest(google_requests.Request):
+    """
+    google.auth transport over the shared session. google.auth always passes
+    timeout=120 itself, so TimeoutSession's default never applies; replace it.
+    """
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        timeout = (settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT)
+        return super().__call__(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+
+def google_auth_request() -> GoogleAuthRequest:
+    """Transport for google.auth calls such as ID token verification."""
+    return GoogleAuthRequest(session=get_session())
+
+
+def http2_enabled() -> bool:
+    """HTTP/2 is opt-in and needs the optional h2 package."""
+    if not settings.UPSTREAM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def loop_local(name: str, factory, close=None):
+    """
+    The value factory() made for `name` on the running event loop. Async
+    clients cannot be reused across loops, and WSGI runs every async view on a
+    loop of its own, so values are kept per loop. `close` (a coroutine function,
+    by default the value's aclose()) runs while the loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    with _loop_locals_lock:
+        for key, (other, _, _) in list(_loop_locals.items()):
+            if other.is_closed():  # Closed without shutting down its async generators
+                del _loop_locals[key]
+        entry = _loop_locals.get(id(loop))
+        if entry is None:
+            values = {}
+            entry = _loop_locals[id(loop)] = (loop, values, _close_at_shutdown(loop, values))
+        values = entry[1]
+        if name not in values:
+            values[name] = (factory(), close)
+        return values[name][0]
+
+
+def _close_at_shutdown(loop, values: dict):
+    """
+    Park an async generator on the running loop. asyncio.run() and asgiref
+    finalize those (loop.shutdown_asyncgens()) before closing a loop, which
+    runs its finally block while the loop can still close connections.
+    """
+    async def closer():
+        try:
+            yield
+        finally:
+            with _loop_locals_lock:
+                _loop_locals.pop(id(loop), None)
+            for value, close in values.values():
+                try:
+                    await (close(value) if close else value.aclose())
+                except Exception:
+                    logger.warning("Could not close an upstream client", exc_info=True)
+
+    generator = closer()
+    try:
+        generator.asend(None).send(None)  # Runs it up to the yield and registers it with the loop
+    except StopIteration:
+        pass
+    return generator
+
+
+def get_async_client(url: str) -> httpx.AsyncClient:
+    """Shared AsyncClient for the host of url on the running event loop."""
+    return loop_local(f"httpx:{urlsplit(url).netloc}", lambda: httpx.AsyncClient(
+        http2=http2_enabled(),
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_POOL_PER_HOST,
+            max_keepalive_connections=settings.UPSTREAM_POOL_PER_HOST,
+        ),
+        timeout=httpx.Timeout(settings.UPSTREAM_READ_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT),
+    ))
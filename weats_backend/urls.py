@@ -16,11 +16,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
+from weats_backend.instrumentation import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/maps/', include("map.urls")),
     path('api/suggestions/', include("suggestions.urls")),
     path('api/users/', include("user.urls")),
-    path('api/visited/',include("visited.urls"))
+    path('api/visited/',include("visited.urls")),
+    path('api/sync/', include("sync.urls")),
+    path('metrics/', metrics_view, name="metrics"),
 ]